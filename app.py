@@ -1,36 +1,62 @@
-from src.map_funcs import load_data, summarise_and_plot
+from src.map_funcs import load_data
+from src.map_pipeline import MapPipeline
+from src.price_cube import build_price_cube
+from src.indexed_frame import build_indexed_frame
+from src.travel_matrix import load_travel_matrix
+from src.utils import profiling
+from src.utils.profiling import span
 import streamlit as st
-import folium
-from streamlit_folium import folium_static
+import streamlit.components.v1 as components
 import pandas as pd
 import json
+import os
+
+# 'frame' filters the raw rows on every rerun, 'index' uses the sorted date and bitmap indexes,
+# 'cube' answers from pre-aggregated price cells
+SUMMARY_BACKEND = os.getenv('HOMERUN_SUMMARY_BACKEND', 'index')
+
+# Stage results and rendered maps are shared by every session in the process
+MAP_CACHE_ENTRIES = int(os.getenv('HOMERUN_MAP_CACHE_ENTRIES', '64'))
+MAP_CACHE_MB = int(os.getenv('HOMERUN_MAP_CACHE_MB', '512'))
+MAP_HEIGHT, MAP_WIDTH = 1100, 2100
+
+# 'folium' sends the full map every rerun, 'stream' sends geometry once and then only attributes
+# ('stream' needs server.enableStaticServing, set in .streamlit/config.toml)
+MAP_MODE = os.getenv('HOMERUN_MAP_MODE', 'folium')
 
-if 'map_cache' not in st.session_state:
-    st.session_state['map_cache'] = dict()  
-    
 st.set_page_config(layout='wide')
+profiling.start_run()
 
 @st.cache_resource
 def get_data():
     return load_data()
 
-def generate_map(gdf, df, df_rent, date_range, home_type, beds, baths, parking):
-    dictionary_lists = (date_range, home_type, beds, baths, parking)
-    dictionary_key = (str(e) for e in dictionary_lists)
+@st.cache_resource
+def get_summary_sources():
+    df, gdf, df_rent = get_data()
+    if SUMMARY_BACKEND == 'cube':
+        return build_price_cube(df), build_price_cube(df_rent)
+    if SUMMARY_BACKEND == 'index':
+        return build_indexed_frame(df), build_indexed_frame(df_rent)
+    return df, df_rent
+
+@st.cache_resource
+def get_travel_matrix():
+    # Memory-mapped, so only the rows of destinations actually picked are read from disk
+    return load_travel_matrix()
 
-    if dictionary_key in st.session_state.map_cache:
-        return st.session_state.map_cache[dictionary_key]
+@st.cache_resource
+def get_pipeline():
+    df, gdf, df_rent = get_data()
+    sales, rent = get_summary_sources()
+    return MapPipeline(gdf, sales, rent, map_entries=MAP_CACHE_ENTRIES, map_bytes=MAP_CACHE_MB * 1024 * 1024, map_mode=MAP_MODE, travel_matrix=get_travel_matrix())
 
-    map_element = summarise_and_plot(gdf, df, df_rent, date_range=date_range, home_type=home_type, beds=beds, baths=baths, parking=parking)
-    
-    st.session_state.map_cache = dict()
-    st.session_state.map_cache[dictionary_key] = map_element
-    folium.LayerControl().add_to(map_element)
-    
-    return map_element
+def generate_map(date_range, home_type, beds, baths, parking, suburb_filters):
+    return get_pipeline().render(date_range, home_type, beds, baths, parking, suburb_filters)
 
 st.sidebar.image('./data/logo/homerun-1.png')
-df, gdf, df_rent = get_data()
+with span('get_data'):
+    df, gdf, df_rent = get_data()
 
 st.sidebar.markdown("### Time Horizon")
 colt1, colt2 = st.sidebar.columns(2)
@@ -54,13 +80,42 @@ max_drive_time_padstow = float(col1.text_input('Drive to Padstow', '45'))
 max_drive_time_kogarah = float(col2.text_input('Drive to Kogarah', '45'))
 max_drive_time_tkmaxx = float(col2.text_input('Drive to TKMaxx', '45'))
 
-gdf_filtered = gdf[
-    (gdf['decile_public_max'] >= min_school_decile) &
-    (gdf['train_to_finity'] <= max_train_time) &
-    (gdf['drive_to_padstow'] <= max_drive_time_padstow) &
-    (gdf['drive_to_kogarah'] <= max_drive_time_kogarah) &
-    (gdf['drive_to_tkmaxx'] <= max_drive_time_tkmaxx)
-]
-m = generate_map(gdf_filtered, df, df_rent, date_range=date_range, home_type=home_type, beds=beds, baths=baths, parking=parking)
+suburb_filters = {
+    'min_school_decile': min_school_decile,
+    'max_train_time': max_train_time,
+    'max_drive_time_padstow': max_drive_time_padstow,
+    'max_drive_time_kogarah': max_drive_time_kogarah,
+    'max_drive_time_tkmaxx': max_drive_time_tkmaxx,
+}
+
+travel_matrix = get_travel_matrix()
+if travel_matrix is not None:
+    st.sidebar.markdown("#### Commute to a suburb")
+    commute_destination = st.sidebar.selectbox('Destination', options=['None'] + sorted(travel_matrix.keys))
+    col3, col4 = st.sidebar.columns(2)
+    commute_mode = col3.selectbox('Mode', options=travel_matrix.modes)
+    max_commute_time = float(col4.text_input('Max minutes', '45'))
+    if commute_destination != 'None':
+        suburb_filters.update(commute_destination=commute_destination, commute_mode=commute_mode, max_commute_time=max_commute_time)
+
+with span('generate_map'):
+    m = generate_map(date_range=date_range, home_type=home_type, beds=beds, baths=baths, parking=parking, suburb_filters=suburb_filters)
+
+with span('components.html'):
+    components.html(m, height=MAP_HEIGHT + 10, width=MAP_WIDTH)
 
-folium_static(m, height=1100, width=2100)
\ No newline at end of file
+# Set HOMERUN_PROFILE=1 (or 'cprofile') to record spans and show this panel
+if profiling.ENABLED:
+    pipeline = get_pipeline()
+    run = profiling.end_run(cache=pipeline.stats())
+    with st.sidebar.expander('Diagnostics'):
+        st.markdown(f"**Last rerun:** {run['total_ms']:.0f} ms")
+        spans = pd.DataFrame(run['spans'], columns=['name', 'depth', 'ms', 'rss_delta_mb'])
+        spans['name'] = spans['depth'].map(lambda depth: '\u00a0' * 4 * depth) + spans['name']
+        st.dataframe(spans.drop(columns='depth'), hide_index=True)
+        cache = pd.DataFrame(pipeline.stats()).T
+        cache['hit_rate'] = pd.Series(pipeline.hit_rates())
+        st.dataframe(cache[['hits', 'misses', 'hit_rate', 'entries']])
+        st.download_button('Export runs (JSON lines)', profiling.runs_jsonl(), file_name='homerun-profile.jsonl')
+        if 'profile' in run:
+            st.code(run['profile'])
\ No newline at end of file
@@ -0,0 +1,265 @@
+from pathlib import Path
+from datetime import datetime
+import geopandas as gpd
+import pandas as pd
+import numpy as np
+import subprocess
+import threading
+import argparse
+import platform
+import tempfile
+import folium
+import json
+import time
+import os
+
+from src.map_funcs import GEO_PATH, SIMPLIFIED_GEO_PATH, SCHOOLS_PATH, SUBURB_MAP_PATH, SALES_PATH, RENT_PATH
+from src.map_funcs import load_data, summarise_data, summarise_rent, prepare_gdf, filter_suburbs, plot_map
+from src.map_pipeline import MapPipeline
+from src.price_cube import build_price_cube
+from src.indexed_frame import build_indexed_frame
+from src.utils.profiling import rss_mb
+
+root_dir = Path(__file__).parent.parent
+
+BENCHMARK_DIR = root_dir / 'benchmarks'
+BENCHMARK_SIZES = [10_000, 1_000_000]
+# The 10M tier needs several GB of RAM and minutes per backend, so it only runs with --full
+FULL_BENCHMARK_SIZES = BENCHMARK_SIZES + [10_000_000]
+SUMMARY_BACKENDS = ['frame', 'index']
+RENT_FRACTION = 0.25
+# A scenario counts as a regression when it is this much slower than the baseline file
+REGRESSION_RATIO = 1.2
+
+HOME_TYPES = ['House', 'Unit', 'Townhouse', 'Semi', 'Villa', 'Studio', 'Terrace', 'Duplex', 'New land']
+HOME_TYPE_WEIGHTS = [0.45, 0.32, 0.08, 0.04, 0.03, 0.03, 0.02, 0.02, 0.01]
+
+DEFAULT_SUBURB_FILTERS = {
+    'min_school_decile': 8,
+    'max_train_time': 60.0,
+    'max_drive_time_padstow': 45.0,
+    'max_drive_time_kogarah': 45.0,
+    'max_drive_time_tkmaxx': 45.0,
+}
+
+def generate_listings(keys, n, rent=False, seed=0, start_date='2021-07-01', days=1100):
+    """Raw sales (or rent) rows in the shape of data/domain/*.csv, spread over the given suburb keys."""
+    rng = np.random.default_rng(seed)
+    keys = pd.Index(keys)
+    suburbs = keys.str.rsplit(' - ', n=1).str[0].str.upper()
+    postcodes = keys.str.rsplit(' - ', n=1).str[1].astype(float)
+
+    # Busier suburbs and pricier suburbs, so groups are uneven as in the real data
+    weights = rng.pareto(1.5, len(keys)) + 1
+    suburb = rng.choice(len(keys), size=n, p=weights / weights.sum())
+    suburb_level = rng.normal(0, 0.35, len(keys))
+
+    beds = np.clip(rng.poisson(2.6, n), 0, 7)
+    home_type = rng.choice(HOME_TYPES, size=n, p=HOME_TYPE_WEIGHTS)
+    base = 6.4 if rent else 13.7
+    price = np.exp(base + suburb_level[suburb] + 0.12 * beds + rng.normal(0, 0.25, n)).round()
+    price[rng.random(n) < 0.01] = np.nan
+
+    df = pd.DataFrame({
+        'suburb': suburbs.values[suburb],
+        'postcode': postcodes.values[suburb],
+        'price': price,
+        'beds': beds.astype(float),
+        'baths': np.clip(rng.poisson(1.4, n), 1, 6).astype(float),
+        'parking': np.clip(rng.poisson(1.2, n), 0, 5).astype(float),
+        'home_type': home_type,
+    })
+    if not rent:
+        df['date_sold'] = pd.Timestamp(start_date) + pd.to_timedelta(rng.integers(0, days, n), unit='D')
+    return df
+
+def link_geo_files(work_dir, data_root=root_dir):
+    # load_data reads ./data/..., so the benchmark runs in a directory holding the real geo files
+    for path in [GEO_PATH, SIMPLIFIED_GEO_PATH, SCHOOLS_PATH, SUBURB_MAP_PATH]:
+        source = Path(data_root).resolve() / path
+        if source.exists():
+            target = Path(work_dir) / path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.symlink_to(source)
+
+def write_listings(work_dir, keys, n, seed=0):
+    target = Path(work_dir) / SALES_PATH
+    target.parent.mkdir(parents=True, exist_ok=True)
+    generate_listings(keys, n, seed=seed).to_csv(target, index=False)
+    generate_listings(keys, max(1, int(n * RENT_FRACTION)), rent=True, seed=seed + 1).to_csv(Path(work_dir) / RENT_PATH, index=False)
+
+class PeakMemory:
+    """Peak RSS growth over a block, sampled from a background thread."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+
+    def __enter__(self):
+        self.start = self.peak = rss_mb()
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def sample(self):
+        while self.running:
+            self.peak = max(self.peak, rss_mb())
+            time.sleep(self.interval)
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+    @property
+    def peak_mb(self):
+        return round(self.peak - self.start, 1)
+
+def measure(results, scenario, rows, func, *args, backend=None, **kwargs):
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+    results.append({
+        'scenario': scenario,
+        'rows': rows,
+        'backend': backend,
+        'seconds': round(seconds, 4),
+        'peak_mb': memory.peak_mb,
+        'rows_per_sec': round(rows / seconds) if seconds > 0 else None,
+    })
+    print(f"{scenario:<28} {backend or '':<6} {rows:>10} rows {seconds:>9.3f}s {memory.peak_mb:>8.1f}MB")
+    return result
+
+def baseline_filters(df):
+    end = df['date_sold'].max().strftime('%Y-%m-%d')
+    return {
+        'date_range': ('2023-03-01', end),
+        'home_type': list(df['home_type'].unique()),
+        'beds': sorted(df['beds'].dropna().unique()),
+        'baths': sorted(df['baths'].dropna().unique()),
+        'parking': sorted(df['parking'].dropna().unique()),
+        'suburb_filters': DEFAULT_SUBURB_FILTERS,
+    }
+
+def filter_changes(filters):
+    """One sidebar change at a time from the baseline, as a user would make them."""
+    return {
+        'date_range': dict(filters, date_range=('2024-01-01', filters['date_range'][1])),
+        'home_type': dict(filters, home_type=['House']),
+        'beds': dict(filters, beds=[b for b in filters['beds'] if b in (2, 3)]),
+        'baths': dict(filters, baths=[b for b in filters['baths'] if b <= 2]),
+        'parking': dict(filters, parking=[p for p in filters['parking'] if p >= 1]),
+        'school_decile': dict(filters, suburb_filters=dict(filters['suburb_filters'], min_school_decile=9)),
+        'commute': dict(filters, suburb_filters=dict(filters['suburb_filters'], max_train_time=30.0)),
+    }
+
+def render_full(gdf, sales, rent, filters):
+    property_filters = {column: filters[column] for column in ['home_type', 'beds', 'baths', 'parking']}
+    summary = summarise_data(sales, suffix='sales', date_range=filters['date_range'], **property_filters)
+    summary_rent = summarise_rent(rent, **property_filters)
+    gdf_comb = filter_suburbs(prepare_gdf(gdf, summary, summary_rent), **filters['suburb_filters']).reset_index(drop=True)
+    map_element = plot_map(gdf_comb)
+    return folium.Figure().add_child(map_element).render()
+
+def run_size(n, backends=SUMMARY_BACKENDS, seed=0, data_root=root_dir):
+    results = []
+    keys = gpd.read_feather(Path(data_root) / GEO_PATH).index
+    with tempfile.TemporaryDirectory() as work_dir:
+        link_geo_files(work_dir, data_root)
+        measure(results, 'generate', n, write_listings, work_dir, keys, n, seed)
+        cwd = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            measure(results, 'load_cold', n, load_data, use_snapshot=False)
+            measure(results, 'load_snapshot_build', n, load_data)
+            df, gdf, df_rent = measure(results, 'load_snapshot_warm', n, load_data)
+        finally:
+            os.chdir(cwd)
+
+    filters = baseline_filters(df)
+    property_filters = {column: filters[column] for column in ['home_type', 'beds', 'baths', 'parking']}
+
+    for backend in backends:
+        if backend == 'cube':
+            sales = measure(results, 'build_source', n, build_price_cube, df, backend=backend)
+            rent = build_price_cube(df_rent)
+        elif backend == 'index':
+            sales = measure(results, 'build_source', n, build_indexed_frame, df, backend=backend)
+            rent = build_indexed_frame(df_rent)
+        else:
+            sales, rent = df, df_rent
+
+        summary = measure(results, 'summarise_sales', n, summarise_data, sales, suffix='sales', date_range=filters['date_range'], backend=backend, **property_filters)
+        summary_rent = measure(results, 'summarise_rent', len(df_rent), summarise_rent, rent, backend=backend, **property_filters)
+        gdf_comb = measure(results, 'prepare_gdf', n, prepare_gdf, gdf, summary, summary_rent, backend=backend)
+        measure(results, 'plot_map', n, plot_map, filter_suburbs(gdf_comb, **filters['suburb_filters']).reset_index(drop=True), backend=backend)
+        measure(results, 'render_full', n, render_full, gdf, sales, rent, filters, backend=backend)
+
+        # Each change starts from a warm baseline, so only the stages it invalidates rerun
+        for change, changed_filters in filter_changes(filters).items():
+            pipeline = MapPipeline(gdf, sales, rent)
+            pipeline.render(**filters)
+            measure(results, f"change_{change}", n, pipeline.render, backend=backend, **changed_filters)
+
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root_dir, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, backends=SUMMARY_BACKENDS, out_path=None, seed=0, data_root=root_dir):
+    results = []
+    for n in sizes:
+        print(f"--- {n} rows")
+        results += run_size(n, backends, seed, data_root)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'results': results,
+    }
+    out_path = Path(out_path or BENCHMARK_DIR / f"benchmark-{report['commit'] or 'local'}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"results saved: {out_path}")
+    return report
+
+def compare_reports(baseline, current, ratio=REGRESSION_RATIO):
+    """Scenarios slower than `ratio` times the baseline, as (scenario, backend, rows, baseline s, current s)."""
+    previous = {(r['scenario'], r['backend'], r['rows']): r['seconds'] for r in baseline['results']}
+    regressions = []
+    for r in current['results']:
+        before = previous.get((r['scenario'], r['backend'], r['rows']))
+        if before and r['seconds'] > before * ratio:
+            regressions.append((r['scenario'], r['backend'], r['rows'], before, r['seconds']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark load -> summarise -> render on synthetic listings')
+    parser.add_argument('--sizes', default=None, help='comma separated row counts, e.g. 10000,1000000,10000000')
+    parser.add_argument('--full', action='store_true', help=f"run {','.join(map(str, FULL_BENCHMARK_SIZES))} rows")
+    parser.add_argument('--backends', default=','.join(SUMMARY_BACKENDS), help='summary backends: frame, index, cube')
+    parser.add_argument('--out', default=None)
+    parser.add_argument('--data-root', default=root_dir, help='directory holding data/geo, if not this checkout')
+    parser.add_argument('--compare', default=None, help='baseline results file to check for regressions')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')] if args.sizes else FULL_BENCHMARK_SIZES if args.full else BENCHMARK_SIZES
+    report = run_benchmarks(sizes, args.backends.split(','), args.out, data_root=args.data_root)
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            regressions = compare_reports(json.load(file), report)
+        for scenario, backend, rows, before, after in regressions:
+            print(f"regression: {scenario} {backend or ''} {rows} rows {before:.3f}s -> {after:.3f}s")
+        if regressions:
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+import geopandas as gpd
+import pandas as pd
+import threading
+import json
+import sys
+import os
+
+from src.utils.snapshot import file_fingerprint, read_manifest, write_manifest, same_sources
+from src.map_funcs import GEO_PATH, SIMPLIFIED_GEO_PATH, load_geo_data
+from src.simplify_geometry import build_simplified_geometries
+from src.travel_matrix import TRAVEL_MATRIX_DIR, TRAVEL_MODES, build_travel_matrix
+import src.get_travel_time_and_seifa as travel
+
+BUILD_DIR = './data/geo/build/'
+METRO_PATH = './data/geo/gdf_metro.feather'
+SEIFA_PATH = './data/geo/seifa.xlsx'
+DURATIONS_PATH = os.path.join(BUILD_DIR, 'durations.parquet')
+SEIFA_TABLE_PATH = os.path.join(BUILD_DIR, 'seifa.parquet')
+MATRIX_KEYS_PATH = os.path.join(TRAVEL_MATRIX_DIR, 'keys.json')
+BUILD_WORKERS = 4
+
+class Stage:
+    """One build step: rerun only when its input files, version or params change, or an output is missing."""
+
+    def __init__(self, name, inputs, outputs, build, version=1, params=None):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.build = build
+        self.version = version
+        # Round-tripped through JSON so it compares equal to the copy kept in the manifest
+        self.params = json.loads(json.dumps(params))
+
+def build_durations(inputs, outputs, destinations):
+    gdf = travel.load_geo_data(inputs[0])
+    travel.commute_durations(gdf, destinations=destinations).to_parquet(outputs[0])
+
+def build_seifa(inputs, outputs, params=None):
+    gdf = travel.load_geo_data(inputs[0])
+    seifa = travel.merge_seifa(pd.DataFrame(gdf[['suburb', 'postcode']]).reset_index(drop=True), pd.read_excel(inputs[1], sheet_name='processed'))
+    seifa['key'] = seifa['suburb'] + " - " + seifa['postcode'].astype(str)
+    seifa.set_index('key').drop(columns=['suburb', 'postcode']).to_parquet(outputs[0])
+
+def build_final(inputs, outputs, params=None):
+    metro_path, durations_path, seifa_path = inputs
+    gdf = travel.load_geo_data(metro_path)
+    gdf = gdf.join(pd.read_parquet(durations_path)).join(pd.read_parquet(seifa_path))
+    gdf.to_feather(outputs[0])
+
+def build_simplified(inputs, outputs, params=None):
+    build_simplified_geometries(gpd.read_feather(inputs[0])).to_feather(outputs[0])
+
+def build_matrix(inputs, outputs, modes):
+    build_travel_matrix(load_geo_data(), modes=modes)
+
+GEO_STAGES = [
+    Stage('durations', [METRO_PATH], [DURATIONS_PATH], build_durations, params=travel.COMMUTE_DESTINATIONS),
+    Stage('seifa', [METRO_PATH, SEIFA_PATH], [SEIFA_TABLE_PATH], build_seifa),
+    Stage('final', [METRO_PATH, DURATIONS_PATH, SEIFA_TABLE_PATH], [GEO_PATH], build_final),
+    Stage('simplified', [GEO_PATH], [SIMPLIFIED_GEO_PATH], build_simplified),
+    Stage('matrix', [GEO_PATH], [MATRIX_KEYS_PATH], build_matrix, params=TRAVEL_MODES),
+]
+
+def stage_dependencies(stages):
+    producers = {output: stage.name for stage in stages for output in stage.outputs}
+    return {stage.name: {producers[path] for path in stage.inputs if path in producers} for stage in stages}
+
+def run_stage(stage, build_dir, lock, force=False):
+    missing = [path for path in stage.inputs if not os.path.exists(path)]
+    if missing:
+        print(f"{stage.name}: missing inputs {missing}")
+        return False
+
+    entry = read_manifest(build_dir).get(stage.name, {})
+    previous = {source['path']: source for source in entry.get('sources', [])}
+    current = [file_fingerprint(path, previous.get(str(path))) for path in stage.inputs]
+    unchanged = entry.get('version') == stage.version and entry.get('params') == stage.params and same_sources(entry.get('sources', []), current)
+    if unchanged and not force and all(os.path.exists(path) for path in stage.outputs):
+        print(f"{stage.name}: up to date")
+        return True
+
+    print(f"{stage.name}: building")
+    for path in stage.outputs:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    try:
+        stage.build(stage.inputs, stage.outputs, stage.params)
+    except Exception as e:
+        print(f"{stage.name}: failed: {e}")
+        return False
+
+    # Stages finish on different threads, so the manifest is re-read and written under a lock
+    with lock:
+        manifest = read_manifest(build_dir)
+        manifest[stage.name] = {'version': stage.version, 'params': stage.params, 'sources': current}
+        write_manifest(build_dir, manifest)
+    return True
+
+def run_stages(stages=GEO_STAGES, names=None, force=False, workers=BUILD_WORKERS, build_dir=BUILD_DIR):
+    """Run stages in dependency order, each wave of independent stages in parallel. Returns {name: succeeded}."""
+    os.makedirs(build_dir, exist_ok=True)
+    dependencies = stage_dependencies(stages)
+    remaining = [stage for stage in stages if names is None or stage.name in names]
+    selected = {stage.name for stage in remaining}
+    lock = threading.Lock()
+    results = {}
+
+    while remaining:
+        # A stage waits only for selected stages; unselected ones are taken as already built
+        ready = [stage for stage in remaining if all(name in results for name in dependencies[stage.name] & selected)]
+        runnable = [stage for stage in ready if all(results.get(name, True) for name in dependencies[stage.name])]
+        for stage in ready:
+            if stage not in runnable:
+                print(f"{stage.name}: skipped, an upstream stage failed")
+                results[stage.name] = False
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(lambda stage: run_stage(stage, build_dir, lock, force), runnable))
+        results.update(zip([stage.name for stage in runnable], outcomes))
+        remaining = [stage for stage in remaining if stage not in ready]
+
+    return results
+
+def main():
+    names = [arg for arg in sys.argv[1:] if not arg.startswith('--')] or None
+    run_stages(names=names, force='--force' in sys.argv)
+
+if __name__ == '__main__':
+    main()
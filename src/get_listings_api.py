@@ -1,8 +1,11 @@
 # import geopandas as gpd
 from src.utils.tg import send_telegram_message
 # from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.utils.ratelimit import TokenBucket
+from src.utils.listing_store import write_partition, ingest_partitions
 import requests
-import json
+import time
 from pandas import json_normalize
 from datetime import datetime
 import os
@@ -14,14 +17,51 @@ load_dotenv()
 root_dir = Path(__file__).parent.parent
 
 DOMAIN_API_KEY = os.getenv('DOMAIN_API_KEY')
+DOMAIN_API_URL = os.getenv('DOMAIN_API_URL', 'https://api.domain.com.au/v1/listings/residential/_search')
+
+# Requests per second across all workers, matched to the API key's quota
+DOMAIN_API_RATE = float(os.getenv('DOMAIN_API_RATE', '2'))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# The search endpoint will not page past this many results
+DOMAIN_MAX_RESULTS = 1000
 
 def ensure_dir(file_path):
     directory = os.path.dirname(file_path)
     if not os.path.exists(directory):
         os.makedirs(directory, exist_ok=True)
 
-def get_listings(suburb, postcode, state='NSW', include_surrounding_suburbs=True, listing_type='Rent', page_size=100, page_number=1, api_key=DOMAIN_API_KEY, return_table=False):
-    v_search = 'https://api.domain.com.au/v1/listings/residential/_search'
+def create_session(pool_size=8):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def search_page(session, body, api_key=DOMAIN_API_KEY, api_url=DOMAIN_API_URL, rate_limiter=None, max_attempts=5, backoff=1.0, timeout=30):
+    headers = {'X-API-Key': api_key}
+    
+    for attempt in range(max_attempts):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            response = session.post(api_url, headers=headers, json=body, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            if attempt == max_attempts - 1:
+                raise
+            print(f"request failed ({e}), retrying")
+            time.sleep(backoff * 2 ** attempt)
+            continue
+
+        if response.status_code in RETRY_STATUSES and attempt < max_attempts - 1:
+            retry_after = response.headers.get('Retry-After')
+            time.sleep(float(retry_after) if retry_after and retry_after.isdigit() else backoff * 2 ** attempt)
+            continue
+        
+        response.raise_for_status() # Raise an exception for HTTP errors
+        return response.json()
+
+def get_listings(suburb, postcode, state='NSW', include_surrounding_suburbs=True, listing_type='Rent', page_size=100, page_number=1, api_key=DOMAIN_API_KEY, return_table=False, max_pages=None, session=None, rate_limiter=None, api_url=DOMAIN_API_URL):
     v_body = {
         "listingType": listing_type,
         "locations": [
@@ -37,32 +77,60 @@ def get_listings(suburb, postcode, state='NSW', include_surrounding_suburbs=True
         "pageSize": page_size,
         "pageNumber": page_number
     }
-    headers = {'X-API-Key': api_key}
+    session = session or create_session(pool_size=1)
         
     try:
-        response = requests.post(v_search, headers=headers, data=json.dumps(v_body))
-        response.raise_for_status() # Raise an exception for HTTP errors
-        df = json_normalize(response.json())
+        # Keep paging until a short page comes back
+        results = []
+        pages = 0
+        while True:
+            page = search_page(session, v_body, api_key=api_key, api_url=api_url, rate_limiter=rate_limiter)
+            results.extend(page)
+            pages += 1
+            if len(page) < page_size or (max_pages is not None and pages >= max_pages):
+                break
+            if (v_body["pageNumber"] + 1) * page_size > DOMAIN_MAX_RESULTS:
+                print(f"{suburb} {postcode}: stopping at the {DOMAIN_MAX_RESULTS} result search limit")
+                break
+            v_body["pageNumber"] += 1
+
+        df = json_normalize(results)
         timestamp = datetime.strftime(datetime.now(), '%Y%m%d')
         # db = DropboxAPI() # Removed DropboxAPI instantiation
         # db_dir = '/edhff/domain-listings-api/' # Old Dropbox path
         
-        file_name = f"{suburb}_{postcode}_{timestamp}.csv"
-        local_dir = root_dir / f"data/domain/listings-api/{listing_type.lower()}/{timestamp}/"
-        local_file_path = local_dir / file_name
-        
-        ensure_dir(local_file_path)
-        df.to_csv(local_file_path, index=False)
+        # Each fetch is its own (date, suburb) partition of the listing dataset
+        write_partition(df, listings_root(listing_type), timestamp, f"{suburb}_{postcode}")
         
         if return_table:
             return df
+        return len(df)
 
     except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error occurred: {http_err} - {response.status_code} - {response.text}")
+        print(f"HTTP error occurred: {http_err} - {http_err.response.status_code} - {http_err.response.text}")
     except Exception as e:
         print(f"error: {e}")
         pass
 
+def harvest_listings(suburbs, listing_type='Sale', workers=8, rate=DOMAIN_API_RATE, api_key=DOMAIN_API_KEY, api_url=DOMAIN_API_URL, progress_every=20):
+    """Fetch every page for each (suburb, postcode) row concurrently over one pooled session."""
+    session = create_session(pool_size=workers)
+    rate_limiter = TokenBucket(rate)
+    counts = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(get_listings, row['suburb'], row['postcode'], listing_type=listing_type, api_key=api_key, api_url=api_url, session=session, rate_limiter=rate_limiter): (row['suburb'], row['postcode'])
+            for _, row in suburbs.iterrows()
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            counts[futures[future]] = future.result()
+            if done % progress_every == 0:
+                send_telegram_message(f'getting suburb {listing_type.lower()}s: {done} of {len(futures)}', production_mode=True, chat_group='updates')
+
+    session.close()
+    return counts
+
 # def get_suburb_list():
 #     gdf = gpd.read_feather('./data/geo/gdf_final.feather')
 #     suburbs = gdf[['suburb', 'postcode']].reset_index(drop=True)
@@ -76,51 +144,32 @@ def get_suburb_shortlist():
     suburbs['suburb'] = suburbs['suburb'].apply(lambda x: x.upper())
     return suburbs
   
-def collate_listings(datestamp=datetime.strftime(datetime.now(), '%Y%m%d')):
+def listings_root(listing_type):
+    return root_dir / f"data/domain/listings-api/{listing_type.lower()}/dataset/"
+
+def collate_listings(listing_type='Sale'):
     # db = DropboxAPI() # Removed DropboxAPI instantiation
-    send_telegram_message('collating sales', production_mode=True, chat_group='updates')
+    send_telegram_message(f'collating {listing_type.lower()}s', production_mode=True, chat_group='updates')
     
-    source_directory_path = root_dir / f'data/domain/listings-api/sale/{datestamp}/'
-    all_files_data = []
-
-    if not source_directory_path.exists():
-        print(f"Source directory {source_directory_path} does not exist. No files to collate.")
-        send_telegram_message(f'Error: Source directory {source_directory_path} not found for collation.', production_mode=True, chat_group='updates')
+    dataset_path = listings_root(listing_type)
+    if not dataset_path.exists():
+        print(f"Dataset {dataset_path} does not exist. No partitions to collate.")
+        send_telegram_message(f'Error: dataset {dataset_path} not found for collation.', production_mode=True, chat_group='updates')
         return
 
-    for file_name in os.listdir(source_directory_path):
-        if file_name.endswith('.csv'):
-            file_path = source_directory_path / file_name
-            try:
-                df_temp = pd.read_csv(file_path)
-                all_files_data.append(df_temp)
-            except Exception as e:
-                print(f"Error reading {file_path}: {e}")
-
-    if not all_files_data:
-        print(f"No CSV files found or read from {source_directory_path}.")
-        send_telegram_message(f'No sales data to collate for {datestamp}.', production_mode=True, chat_group='updates')
+    # Only partitions written since the last run are read
+    new_partitions = ingest_partitions(dataset_path)
+    if not new_partitions:
+        print(f"No new partitions in {dataset_path}.")
+        send_telegram_message(f'No new {listing_type.lower()}s data to collate.', production_mode=True, chat_group='updates')
         return
-        
-    df_raw = pd.concat(all_files_data, ignore_index=True)
-    
-    collated_dir_path = root_dir / 'data/domain/listings-api/sale/collated/'
-    collated_file_path = collated_dir_path / f'sales_{datestamp}.csv'
-    
-    ensure_dir(collated_file_path)
-    df_raw.to_csv(collated_file_path, index=False)
-    
-    send_telegram_message(f'sales collated to {collated_file_path}', production_mode=True, chat_group='updates')
+
+    rows = sum(entry['rows'] for entry in new_partitions.values())
+    send_telegram_message(f'{listing_type.lower()}s collated: {len(new_partitions)} partitions, {rows} rows in {dataset_path}', production_mode=True, chat_group='updates')
 
 def get_current_sales_listings():
     suburbs = get_suburb_shortlist()
-    
-    for index, row in suburbs.iterrows():
-        # get_listings(row['suburb'], row['postcode'])
-        if index % 20 == 0:
-            send_telegram_message(f'getting suburb sales: {index} of {suburbs.shape[0]}', production_mode=True, chat_group='updates')
-        get_listings(row['suburb'], row['postcode'], listing_type='Sale')
-
+    harvest_listings(suburbs, listing_type='Sale')
     collate_listings()
     return
 
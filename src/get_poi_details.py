@@ -4,23 +4,80 @@ from dotenv import load_dotenv
 import pandas as pd
 import geopandas as gpd
 from pathlib import Path
-from utils.funcs import to_txt
-import json 
+from src.utils.funcs import to_txt
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import json
 from tqdm import tqdm
 
 root_dir = Path(__file__).parent.parent
 load_dotenv(root_dir / '.env')
 
-def get_poi_details(poi_str, cache_dir=root_dir / 'data/cache/maps-api/'):
-    
+CACHE_DIR = root_dir / 'data/cache/maps-api/'
+GEOCODE_WORKERS = 8
+# POIs the API has no match for are remembered for a while so a bad name is not re-queried on every run;
+# transport and quota errors are never cached
+NEGATIVE_CACHE_DAYS = 7
+NO_RESULT_STATUSES = ('ZERO_RESULTS', 'NOT_FOUND')
+POI_FIELDS = ['poi', 'address', 'street_number', 'street_name', 'suburb', 'postcode', 'latitude', 'longitude']
+
+gmaps = None
+client_lock = threading.Lock()
+
+def maps_client():
+    # One client for all lookups so its HTTP session and rate limiting are shared between threads
+    global gmaps
+    with client_lock:
+        if gmaps is None:
+            gmaps = googlemaps.Client(key=os.getenv("GOOGLE_MAPS_API_KEY"))
+    return gmaps
+
+def poi_name(poi_str):
+    return poi_str.replace(', Sydney NSW', '')
+
+def cache_path(poi_str, cache_dir=CACHE_DIR):
+    return Path(cache_dir) / f"{poi_name(poi_str).replace(os.sep, '-')}.json"
+
+def read_cached(file_path):
+    try:
+        with open(file_path, 'r') as file:
+            cached = json.load(file)
+    except (IOError, ValueError):
+        return None
+    if 'failed_at' in cached:
+        if time.time() - cached['failed_at'] > NEGATIVE_CACHE_DAYS * 86400:
+            return None
+        return dict.fromkeys(POI_FIELDS)
+    return cached
+
+def get_poi_details(poi_str, cache_dir=CACHE_DIR, client=None):
+
+    file_path = cache_path(poi_str, cache_dir)
+    cached = read_cached(file_path)
+    if cached is not None:
+        return cached
+
     # Initialise and search
-    gmaps = googlemaps.Client(key=os.getenv("GOOGLE_MAPS_API_KEY"))
-    
+    gmaps = client or maps_client()
+
     try:
         search_result = gmaps.places(poi_str)
-        place_id = search_result['results'][0]['place_id']
-        place_details = gmaps.place(place_id=place_id)
+        place_details = gmaps.place(place_id=search_result['results'][0]['place_id']) if search_result['results'] else None
+    except googlemaps.exceptions.ApiError as e:
+        if e.status not in NO_RESULT_STATUSES:
+            # Quota, key and other request errors say nothing about the POI, so it is retried next run
+            print(f"lookup failed for {poi_str}: {e}")
+            return dict.fromkeys(POI_FIELDS)
+        place_details = None
+    except (googlemaps.exceptions.TransportError, googlemaps.exceptions.Timeout) as e:
+        print(f"lookup failed for {poi_str}: {e}")
+        return dict.fromkeys(POI_FIELDS)
 
+    if place_details is None:
+        result = dict.fromkeys(POI_FIELDS)
+        cache_entry = {'failed_at': time.time(), 'error': 'no result'}
+    else:
         # Extracting required details
         details = place_details['result']['address_components']
         address_dict = {item['types'][0]: item['long_name'] for item in details}
@@ -34,7 +91,7 @@ def get_poi_details(poi_str, cache_dir=root_dir / 'data/cache/maps-api/'):
         longitude = location['lng']
 
         result = {
-            'poi': poi_str.replace(', Sydney NSW', ''),
+            'poi': poi_name(poi_str),
             'address': address,
             'street_number': street_number,
             'street_name': street_name,
@@ -43,38 +100,36 @@ def get_poi_details(poi_str, cache_dir=root_dir / 'data/cache/maps-api/'):
             'latitude': latitude,
             'longitude': longitude
         }
-        
-        json_data = json.dumps(result, indent=4)
-        file_path = cache_dir / f"{poi_str.replace(', Sydney NSW', '')}.json"
-        with open(file_path, 'w') as file:
-            file.write(json_data)
-        
-        # print(f'details saved: {file_path}')
-
-    except Exception as e:
-        result = {
-            'poi': None,
-            'address': None,
-            'street_number': None,
-            'street_name': None,
-            'suburb': None,
-            'postcode': None,
-            'latitude': None,
-            'longitude': None
-        }
+        cache_entry = result
+
+    os.makedirs(cache_dir, exist_ok=True)
+    to_txt(json.dumps(cache_entry, indent=4), file_path)
+    # print(f'details saved: {file_path}')
 
     return result
 
+def get_pois_details(pois, cache_dir=CACHE_DIR, workers=GEOCODE_WORKERS, client=None):
+    """Details for each POI in order: cached ones are read directly, misses are looked up on a bounded pool."""
+    results = {poi: read_cached(cache_path(poi, cache_dir)) for poi in dict.fromkeys(pois)}
+    misses = [poi for poi, result in results.items() if result is None]
+    print(f"{len(results) - len(misses)} cached, {len(misses)} to look up")
+
+    if misses:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            details = executor.map(lambda poi: get_poi_details(poi, cache_dir, client), misses)
+            results.update(zip(misses, tqdm(details, 'processing', total=len(misses))))
+
+    return [results[poi] for poi in pois]
+
 def main():
     df = pd.read_excel(root_dir / 'data/geo/pois.xlsx', sheet_name='pois')
     pois = [poi + ', Sydney NSW' for poi in df['poi'].to_list()]
-    geo_data = [get_poi_details(poi) for poi in tqdm(pois, 'processing')]
+    geo_data = get_pois_details(pois)
     geo_data_df = pd.DataFrame(geo_data)
     geo_data_df = pd.merge(geo_data_df, df[['poi', 'public_school_percentile']], how='left', on='poi')
     geo_data_df.to_csv(root_dir/'data/geo/pois_processed.csv')
 
 if __name__ == '__main__':
     main()
-    
 
 
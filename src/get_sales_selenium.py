@@ -5,12 +5,79 @@ from datetime import datetime
 # from utils.tg import send_telegram_message
 import geopandas as gpd
 import requests
+import multiprocessing as mp
+import queue
+import threading
 import pytz
+import time
+import json
+import re
 import os
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
 from src.utils.uc import safe_find_element, set_up_driver
-from src.utils.tg import send_telegram_message
+from src.utils.tg import send_telegram_message, flush_telegram_messages
+from src.utils.listing_store import write_partition, ingest_partitions, read_watermarks, write_watermarks
+from src.utils.frontier import CrawlFrontier
+
+SALES_DATASET = './data/domain/sales-selenium/dataset/'
+FRONTIER_PATH = './data/domain/sales-selenium/frontier.sqlite'
 
+CARD_CLASS = 'css-1qp9106'
+LISTING_COLUMNS = ['link', 'price', 'address1', 'address2', 'beds', 'baths', 'parking', 'sqm', 'home_type', 'image_links', 'sold_by', 'method_and_date_sold', 'latitude', 'longitude']
+
+# Collects every card's fields in one round trip; text cleanup is shared with the element path
+EXTRACT_CARDS_JS = """
+const text = (parent, selector) => {
+    const element = parent ? parent.querySelector(selector) : null;
+    return element ? element.innerText : null;
+};
+// Coordinates are not rendered on the card, but the page's hydration data has them per listing URL
+const listingsMap = (((window.__NEXT_DATA__ || {}).props || {}).pageProps || {}).componentProps?.listingsMap || {};
+const coordinates = {};
+Object.values(listingsMap).forEach(listing => {
+    const model = listing.listingModel || {};
+    if (model.url && model.address) {
+        // model.url may be relative or absolute; cards are matched on the path alone
+        coordinates[new URL(model.url, location.origin).pathname] = [model.address.lat ?? null, model.address.lng ?? null];
+    }
+});
+return Array.from(document.getElementsByClassName(arguments[0])).map(card => {
+    const features = card.querySelector("[data-testid='property-features']");
+    const link = card.querySelector("a[href]");
+    const brand = card.querySelector("[data-testid='listing-card-branding'] img");
+    return {
+        price: text(card, "[data-testid='listing-card-price']"),
+        link: link ? link.href : null,
+        address1: text(card, "[data-testid='address-line1']"),
+        address2: text(card, "[data-testid='address-line2']"),
+        features: features ? [1, 2, 3, 4].map(i => text(features, "[data-testid='property-features-feature']:nth-child(" + i + ")")) : null,
+        home_type: text(card, ".css-11n8uyu"),
+        images: Array.from(card.querySelectorAll("[data-testid='listing-card-lazy-image'] img")).map(img => img.src),
+        sold_by: brand ? brand.alt : null,
+        tag: text(card, "[data-testid='listing-card-tag'] span"),
+        coordinates: link ? coordinates[new URL(link.href).pathname] || null : null,
+    };
+});
+"""
+
+# Browser-free backend: the results page embeds its listings as JSON for hydration
+NEXT_DATA_PATTERN = re.compile(r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>', re.S)
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml',
+    'Accept-Language': 'en-AU,en;q=0.9',
+}
+HTTP_POOL_SIZE = 32
+HTTP_SESSION = None
+
+# Drivers are replaced when Chrome grows past this size or after repeated page failures
+DRIVER_MAX_MEMORY_MB = 1500
+DRIVER_MAX_ERRORS = 3
 
 timezone = pytz.timezone('Australia/Sydney')
 
@@ -19,8 +86,111 @@ def ensure_dir(file_path):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-def get_listing(locality, page, driver):
-    link = f"https://www.domain.com.au/sold-listings/{locality}/?excludepricewithheld=1&ssubs=0&page={page}"
+def element_row(listing):
+    price = safe_find_element(listing, By.CSS_SELECTOR, "[data-testid='listing-card-price']", remove_text=' price from APM PriceFinder')
+    link = safe_find_element(listing, By.CSS_SELECTOR, "a[href]", 'href')
+    print(f"--- {link}")
+    address_line1 = safe_find_element(listing, By.CSS_SELECTOR, "[data-testid='address-line1']", remove_text=',')
+    address_line2 = safe_find_element(listing, By.CSS_SELECTOR, "[data-testid='address-line2']")
+    
+    try:
+        property_features = listing.find_element(By.CSS_SELECTOR, "[data-testid='property-features']")         
+        beds = safe_find_element(property_features, By.CSS_SELECTOR, "[data-testid='property-features-feature']:nth-child(1)", remove_text= '\nBeds')
+        bath = safe_find_element(property_features, By.CSS_SELECTOR, "[data-testid='property-features-feature']:nth-child(2)", remove_text='\nBaths|\nBath')
+        parking = safe_find_element(property_features, By.CSS_SELECTOR, "[data-testid='property-features-feature']:nth-child(3)", remove_text='\nParking')
+    except Exception:
+        property_features = None
+        beds, bath, parking = None, None, None
+        
+    try:
+        sqm = safe_find_element(property_features, By.CSS_SELECTOR, "[data-testid='property-features-feature']:nth-child(4)")
+        sqm = sqm.replace('m²', '') if sqm else None
+    except Exception:
+        sqm = None
+        
+    home_type = safe_find_element(listing, By.CLASS_NAME, "css-11n8uyu")
+    if home_type:
+        home_type = home_type.replace('Apartment / Unit / Flat', 'Unit')
+
+    img_links = [img.get_attribute('src') for img in listing.find_elements(By.CSS_SELECTOR, "[data-testid='listing-card-lazy-image'] img")]
+                        
+    sold_by = safe_find_element(listing, By.CSS_SELECTOR, "[data-testid='listing-card-branding'] img", 'alt', remove_text='Logo for ')
+    method_and_date_sold = safe_find_element(listing, By.CSS_SELECTOR, "[data-testid='listing-card-tag'] span")
+
+    # The element fallback has no hydration data, so no coordinates; those rows keep the string key
+    return [link, price, address_line1, address_line2, beds, bath, parking, sqm, home_type, img_links, sold_by, method_and_date_sold, None, None]
+
+def remove_pattern(text, remove_text):
+    return re.sub(remove_text, '', text) if text is not None else None
+
+def script_row(card):
+    features = card['features']
+    if features is None:
+        beds, bath, parking, sqm = None, None, None, None
+    else:
+        beds = remove_pattern(features[0], '\nBeds')
+        bath = remove_pattern(features[1], '\nBaths|\nBath')
+        parking = remove_pattern(features[2], '\nParking')
+        sqm = features[3].replace('m²', '') if features[3] else None
+
+    home_type = card['home_type']
+    if home_type:
+        home_type = home_type.replace('Apartment / Unit / Flat', 'Unit')
+    latitude, longitude = card.get('coordinates') or (None, None)
+
+    return [
+        card['link'],
+        remove_pattern(card['price'], ' price from APM PriceFinder'),
+        remove_pattern(card['address1'], ','),
+        card['address2'],
+        beds, bath, parking, sqm,
+        home_type,
+        card['images'],
+        remove_pattern(card['sold_by'], 'Logo for '),
+        card['tag'],
+        latitude,
+        longitude,
+    ]
+
+def find_cards(driver, extract_mode):
+    if extract_mode == 'script':
+        try:
+            return driver.execute_script(EXTRACT_CARDS_JS, CARD_CLASS)
+        except Exception as e:
+            print(f"card script failed, falling back to elements: {e}")
+    return driver.find_elements(By.CLASS_NAME, CARD_CLASS)
+
+def listing_url(locality, page):
+    return f"https://www.domain.com.au/sold-listings/{locality}/?excludepricewithheld=1&ssubs=0&page={page}"
+
+def listing_frame(data):
+    df = pd.DataFrame(data, columns=LISTING_COLUMNS)
+    df['method_sold'] = df['method_and_date_sold'].apply(lambda x: x[:-12].replace('SOLD ', '').strip().title())
+    df['date_sold'] = pd.to_datetime(df['method_and_date_sold'].str[-11:], format='%d %b %Y')
+    df['price'] = df['price'].replace({'\$': '', ',': ''}, regex=True).astype(int)
+    return df
+
+class LazyDriver:
+    """Starts a Chrome driver only when a page first needs one."""
+
+    def __init__(self):
+        self.driver = None
+
+    def get(self):
+        if self.driver is None:
+            self.driver = set_up_driver()
+        return self.driver
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.close()
+            self.driver = None
+
+def new_driver(backend):
+    return LazyDriver() if backend == 'http' else set_up_driver()
+
+def get_listing(locality, page, driver, extract_mode='script'):
+    link = listing_url(locality, page)
     print(link)
     datestamp = datetime.now(timezone).strftime("%Y%m%d")
     page_0 = '{:02d}'.format(page)    
@@ -29,7 +199,7 @@ def get_listing(locality, page, driver):
         if attempt > 0:
             send_telegram_message(f"{locality}: page {page} - {len(listings)} listings - attempt {attempt+1}") 
         driver.get(link)
-        listings = driver.find_elements(By.CLASS_NAME, 'css-1qp9106')
+        listings = find_cards(driver, extract_mode)
         if len(listings) == 20:
             break
         else:
@@ -40,60 +210,98 @@ def get_listing(locality, page, driver):
             ensure_dir(error_file_path)
             error_df.to_csv(error_file_path, index=False)
     
-    data = []
     # listings = driver.find_elements(By.CLASS_NAME, 'css-1qp9106')
     send_telegram_message(f"{locality}: page {page} - {len(listings)} listings")
     
-    for listing in listings:
-        price = safe_find_element(listing, By.CSS_SELECTOR, "[data-testid='listing-card-price']", remove_text=' price from APM PriceFinder')
-        link = safe_find_element(listing, By.CSS_SELECTOR, "a[href]", 'href')
-        print(f"--- {link}")
-        address_line1 = safe_find_element(listing, By.CSS_SELECTOR, "[data-testid='address-line1']", remove_text=',')
-        address_line2 = safe_find_element(listing, By.CSS_SELECTOR, "[data-testid='address-line2']")
-        
-        try:
-            property_features = listing.find_element(By.CSS_SELECTOR, "[data-testid='property-features']")         
-            beds = safe_find_element(property_features, By.CSS_SELECTOR, "[data-testid='property-features-feature']:nth-child(1)", remove_text= '\nBeds')
-            bath = safe_find_element(property_features, By.CSS_SELECTOR, "[data-testid='property-features-feature']:nth-child(2)", remove_text='\nBaths|\nBath')
-            parking = safe_find_element(property_features, By.CSS_SELECTOR, "[data-testid='property-features-feature']:nth-child(3)", remove_text='\nParking')
-        except Exception:
-            beds, bath, parking = None, None, None
-            
-        try:
-            sqm = safe_find_element(property_features, By.CSS_SELECTOR, "[data-testid='property-features-feature']:nth-child(4)")
-            sqm = sqm.replace('m²', '') if sqm else None
-        except Exception:
-            sqm = None
-            
-        home_type = safe_find_element(listing, By.CLASS_NAME, "css-11n8uyu")
-        if home_type:
-            home_type = home_type.replace('Apartment / Unit / Flat', 'Unit')
-
-        img_links = [img.get_attribute('src') for img in listing.find_elements(By.CSS_SELECTOR, "[data-testid='listing-card-lazy-image'] img")]
-                            
-        sold_by = safe_find_element(listing, By.CSS_SELECTOR, "[data-testid='listing-card-branding'] img", 'alt', remove_text='Logo for ')
-        method_and_date_sold = safe_find_element(listing, By.CSS_SELECTOR, "[data-testid='listing-card-tag'] span")
+    # Cards from the script are already plain dicts; WebElements need a round trip per field
+    data = [script_row(listing) if isinstance(listing, dict) else element_row(listing) for listing in listings]
 
-        data.append([link, price, address_line1, address_line2, beds, bath, parking, sqm, home_type, img_links, sold_by, method_and_date_sold])
-
-    df = pd.DataFrame(data, columns=['link','price', 'address1', 'address2', 'beds', 'baths', 'parking', 'sqm', 'home_type', 'image_links', 'sold_by', 'method_and_date_sold'])
-    df['method_sold'] = df['method_and_date_sold'].apply(lambda x: x[:-12].replace('SOLD ', '').strip().title())
-    df['date_sold'] = pd.to_datetime(df['method_and_date_sold'].str[-11:], format='%d %b %Y')
-    df['price'] = df['price'].replace({'\$': '', ',': ''}, regex=True).astype(int)
+    df = listing_frame(data)
 
     # db = DropboxAPI() # Removed DropboxAPI instantiation
     
-    output_file_path = f"./data/domain/sales-selenium/{locality}_{page_0}_{datestamp}.csv"
-    ensure_dir(output_file_path)
-    df.to_csv(output_file_path, index=False)
+    df.attrs['output_file'] = write_partition(df, SALES_DATASET, datestamp, locality, part=f"page-{page_0}")
+
+    return df
+
+def http_session():
+    global HTTP_SESSION
+    if HTTP_SESSION is None:
+        HTTP_SESSION = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        HTTP_SESSION.mount('https://', adapter)
+        HTTP_SESSION.headers.update(HTTP_HEADERS)
+    return HTTP_SESSION
+
+def next_data_cards(html):
+    """Listing cards from the page's embedded __NEXT_DATA__ JSON, in the same shape EXTRACT_CARDS_JS returns."""
+    match = NEXT_DATA_PATTERN.search(html)
+    if match is None:
+        raise ValueError('page has no __NEXT_DATA__')
+    component_props = json.loads(match.group(1))['props']['pageProps']['componentProps']
+    listings_map = component_props['listingsMap']
+    listing_ids = component_props.get('listingSearchResultIds') or list(listings_map)
+
+    cards = []
+    for listing_id in listing_ids:
+        listing = listings_map.get(str(listing_id), {})
+        if listing.get('listingType', 'listing') != 'listing':
+            continue
+        model = listing['listingModel']
+        address = model.get('address', {})
+        features = model.get('features', {})
+        land_size = features.get('landSize')
+        url = model.get('url')
+        tag = (model.get('tags') or {}).get('tagText')
+        cards.append({
+            'price': model.get('price'),
+            'link': f"https://www.domain.com.au{url}" if url and url.startswith('/') else url,
+            'address1': address.get('street'),
+            'address2': ' '.join(str(part) for part in [address.get('suburb'), address.get('state'), address.get('postcode')] if part),
+            'features': [
+                str(features['beds']) if features.get('beds') is not None else None,
+                str(features['baths']) if features.get('baths') is not None else None,
+                str(features['parking']) if features.get('parking') is not None else None,
+                f"{land_size}m²" if land_size else None,
+            ],
+            'home_type': features.get('propertyTypeFormatted'),
+            'images': model.get('images', []),
+            'sold_by': (model.get('branding') or {}).get('brandName'),
+            'coordinates': [address.get('lat'), address.get('lng')],
+            # The card renders this tag upper-cased, which method_sold parsing relies on
+            'tag': tag.upper() if tag else None,
+        })
+    return cards
+
+def get_listing_http(locality, page, driver=None, extract_mode='script'):
+    """Fetch and parse a results page without a browser, falling back to Selenium if it does not parse."""
+    link = listing_url(locality, page)
+    print(link)
+    datestamp = datetime.now(timezone).strftime("%Y%m%d")
+    page_0 = '{:02d}'.format(page)
 
+    try:
+        response = http_session().get(link, timeout=30)
+        response.raise_for_status()
+        cards = next_data_cards(response.text)
+    except Exception as e:
+        if driver is None:
+            raise
+        print(f"{locality}: page {page} did not parse ({e}), falling back to selenium")
+        return get_listing(locality, page, driver.get() if isinstance(driver, LazyDriver) else driver, extract_mode=extract_mode)
+
+    df = listing_frame([script_row(card) for card in cards])
+    df.attrs['output_file'] = write_partition(df, SALES_DATASET, datestamp, locality, part=f"page-{page_0}")
     return df
 
-def get_listing_error_handled(locality, page, driver):
+def get_listing_error_handled(locality, page, driver, extract_mode='script', backend='selenium'):
     try:
-        df = get_listing(locality, page, driver)
+        if backend == 'http':
+            df = get_listing_http(locality, page, driver, extract_mode=extract_mode)
+        else:
+            df = get_listing(locality, page, driver, extract_mode=extract_mode)
     except Exception as e:
-        df = pd.DataFrame(columns=['link', 'price', 'address1', 'address2', 'beds', 'baths', 'parking', 'sqm', 'home_type', 'image_links', 'sold_by', 'method_and_date_sold'])
+        df = pd.DataFrame(columns=LISTING_COLUMNS)
         # db = DropboxAPI() # Removed DropboxAPI instantiation
         page_0 = '{:02d}'.format(page)
         error_file_path = f"./data/domain/sales-selenium/errors/{locality}_{page_0}.csv"
@@ -102,7 +310,92 @@ def get_listing_error_handled(locality, page, driver):
     finally:
         return df
 
-def get_listings(localities, pages=50, start=1, date_cutoff='2021-07-01'):
+def driver_memory_mb(driver):
+    if psutil is None:
+        return 0
+    try:
+        pid = getattr(driver, 'browser_pid', None) or driver.service.process.pid
+        process = psutil.Process(pid)
+        return sum(p.memory_info().rss for p in [process] + process.children(recursive=True)) / 1024 ** 2
+    except Exception:
+        return 0
+
+def needs_recycle(driver, errors, max_memory_mb=DRIVER_MAX_MEMORY_MB, max_errors=DRIVER_MAX_ERRORS):
+    return errors >= max_errors or driver_memory_mb(driver) > max_memory_mb
+
+def page_failed(df):
+    return df.empty or 'date_sold' not in df.columns
+
+def page_watermark(df):
+    """Newest sold date on a page plus every link sold that day, since same-day listings can come in any order."""
+    newest = df['date_sold'].max()
+    return {'date_sold': newest.strftime('%Y-%m-%d'), 'links': sorted(df.loc[df['date_sold'] == newest, 'link'].dropna().unique())}
+
+def merge_watermark(mark, new_mark):
+    if not mark or new_mark['date_sold'] > mark['date_sold']:
+        return new_mark
+    if new_mark['date_sold'] == mark['date_sold']:
+        return {'date_sold': mark['date_sold'], 'links': sorted(set(mark['links']) | set(new_mark['links']))}
+    return mark
+
+def overlaps_watermark(df, mark):
+    if not mark or page_failed(df):
+        return False
+    # Results are newest first, so the page overlaps once it reaches older sales or ends on a known link
+    mark_date = pd.to_datetime(mark['date_sold'])
+    return bool((df['date_sold'] < mark_date).any() or df['link'].iloc[-1] in mark['links'])
+
+def scrape_done(df, page, last_page, cutoff_date, watermark=None):
+    try:
+        return df['date_sold'].min() < cutoff_date or page >= last_page or overlaps_watermark(df, watermark)
+    except Exception:
+        return page >= last_page
+
+def advance_watermarks(new_partitions, root=SALES_DATASET, frontier_path=FRONTIER_PATH):
+    """Move each locality's watermark up to the newest listing its crawl runs fetched without gaps.
+
+    The pages come from the frontier rather than the new partitions alone, so a mark never passes
+    a page that failed or was never reached; those stay newer than the mark and are fetched next run.
+    """
+    watermarks = read_watermarks(root)
+    new_files = {}
+    for relative_path, entry in new_partitions.items():
+        if entry['rows']:
+            new_files.setdefault(entry['suburb'], []).append(os.path.join(root, relative_path))
+
+    frontier = CrawlFrontier(frontier_path, None)
+    for locality, files in new_files.items():
+        run_ids = frontier.output_runs(locality, files)
+        if not run_ids:
+            print(f"{locality}: no crawl run recorded for {len(files)} new partitions, watermark left as is")
+            continue
+        pages = []
+        for run_id in run_ids:
+            run = CrawlFrontier(frontier_path, run_id)
+            pages += [path for path in run.watermark_pages(locality) if os.path.exists(path)]
+            run.close()
+        if not pages:
+            print(f"{locality}: crawl unfinished or no page past its last failure, watermark left as is")
+            continue
+        df = pd.concat([pd.read_parquet(path, columns=['link', 'date_sold']) for path in pages])
+        if not df.empty:
+            watermarks[locality] = merge_watermark(watermarks.get(locality), page_watermark(df))
+    frontier.close()
+
+    # Written in one replace, so a failed run leaves the previous marks in place
+    write_watermarks(root, watermarks)
+    return watermarks
+
+def crawl_frontier(run_id=None):
+    # Runs are keyed by day by default, matching the partition date, so a same-day restart resumes
+    return CrawlFrontier(FRONTIER_PATH, run_id or datetime.now(timezone).strftime("%Y%m%d"))
+
+def record_page(frontier, locality, page, df):
+    failed = page_failed(df)
+    frontier.record(locality, page, failed, None if failed else df.attrs.get('output_file'))
+    return failed
+
+def get_listings(localities, pages=50, start=1, date_cutoff='2021-07-01', backend='selenium', incremental=True, run_id=None):
        
     send_telegram_message(f"scraping {localities}, pages {start}-{start+pages-1}")
     
@@ -112,29 +405,143 @@ def get_listings(localities, pages=50, start=1, date_cutoff='2021-07-01'):
         localities = [localities]
     
     cutoff_date = pd.to_datetime(date_cutoff)
+    last_page = start + pages - 1
+    watermarks = read_watermarks(SALES_DATASET) if incremental else {}
+    frontier = crawl_frontier(run_id)
 
     for i, locality in enumerate(localities):
+        retries, head = frontier.plan(locality, start, last_page)
+        tasks = retries + ([head] if head is not None else [])
+        if not tasks:
+            continue
+
         send_telegram_message(f"{i} of {len(localities)} - {locality}")
-        driver = set_up_driver()
+        driver = new_driver(backend)
+        errors = 0
         
-        for page in range(start, pages + start):
-            if page == 26:
+        while tasks:
+            page = tasks.pop(0)
+            if needs_recycle(driver, errors):
                 driver.close()
-                driver = set_up_driver()
+                driver = new_driver(backend)
+                errors = 0
 
-            df = get_listing_error_handled(locality, page, driver)
+            frontier.schedule(locality, page)
+            df = get_listing_error_handled(locality, page, driver, backend=backend)
             df_all.append(df)
-            
-            try:
-                if df['date_sold'].min() < cutoff_date or page == 50:
-                    send_telegram_message(f"scraped to: {df['date_sold'].min()}")
-                    break
-            except Exception as e:
-                pass
+            errors += record_page(frontier, locality, page, df)
+
+            if page != head:
+                continue
+            if scrape_done(df, page, last_page, cutoff_date, watermarks.get(locality)):
+                frontier.finish(locality)
+                send_telegram_message(f"scraped to: {df['date_sold'].min() if 'date_sold' in df.columns else page}")
+            else:
+                head = page + 1
+                tasks.append(head)
                             
         driver.close()
-        
-    return pd.concat(df_all)
+
+    print(f"frontier {frontier.run_id}: {frontier.summary()}")
+    frontier.close()
+    return pd.concat(df_all) if df_all else pd.DataFrame()
+
+def scrape_worker(worker_id, tasks, results, stagger_seconds=2, backend='selenium'):
+    # undetected_chromedriver patches its binary on start-up, so drivers are started one at a time
+    time.sleep(worker_id * stagger_seconds)
+    driver = new_driver(backend)
+    errors = 0
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        locality, page = task
+
+        if needs_recycle(driver, errors):
+            print(f"worker {worker_id}: recycling driver")
+            driver.close()
+            driver = new_driver(backend)
+            errors = 0
+
+        df = get_listing_error_handled(locality, page, driver, backend=backend)
+        errors += page_failed(df)
+        results.put((locality, page, df))
+
+    driver.close()
+    flush_telegram_messages()
+
+def get_listings_parallel(localities, workers=4, pages=50, start=1, date_cutoff='2021-07-01', result_timeout=60, backend='selenium', incremental=True, run_id=None):
+    """Scrape localities with a pool of workers sharing one (locality, page) queue.
+
+    Pages of one locality stay in order, since whether to fetch the next page depends on the
+    dates on the current one; different localities run in parallel. Selenium workers are
+    processes with one driver each; HTTP workers are threads, so many can run per core.
+    With incremental on, a locality stops at the first page that reaches its stored watermark.
+    Progress is kept in the crawl frontier, so re-running the same run_id retries only failed pages.
+    """
+    if not isinstance(localities, list):
+        localities = [localities]
+    send_telegram_message(f"scraping {len(localities)} localities with {workers} {backend} workers, pages {start}-{start+pages-1}")
+
+    cutoff_date = pd.to_datetime(date_cutoff)
+    last_page = start + pages - 1
+    watermarks = read_watermarks(SALES_DATASET) if incremental else {}
+    frontier = crawl_frontier(run_id)
+    if backend == 'http':
+        tasks, results = queue.Queue(), queue.Queue()
+        processes = [threading.Thread(target=scrape_worker, args=(i, tasks, results, 0, backend), daemon=True) for i in range(workers)]
+    else:
+        context = mp.get_context('spawn')
+        tasks, results = context.Queue(), context.Queue()
+        processes = [context.Process(target=scrape_worker, args=(i, tasks, results, 2, backend), daemon=True) for i in range(workers)]
+    for process in processes:
+        process.start()
+
+    heads = {}
+    pending = 0
+    for locality in localities:
+        retries, head = frontier.plan(locality, start, last_page)
+        if head is not None:
+            heads[locality] = head
+        for page in retries + ([head] if head is not None else []):
+            frontier.schedule(locality, page)
+            tasks.put((locality, page))
+            pending += 1
+    df_all = []
+
+    while pending:
+        try:
+            locality, page, df = results.get(timeout=result_timeout)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                print(f"all scrape workers exited with {pending} pages outstanding")
+                break
+            continue
+
+        pending -= 1
+        df_all.append(df)
+        record_page(frontier, locality, page, df)
+        # Retried pages fill gaps; only the locality's furthest page decides whether to go on
+        if page != heads.get(locality):
+            continue
+        if scrape_done(df, page, last_page, cutoff_date, watermarks.get(locality)):
+            frontier.finish(locality)
+            send_telegram_message(f"{locality}: scraped to page {page}")
+        else:
+            heads[locality] = page + 1
+            frontier.schedule(locality, page + 1)
+            tasks.put((locality, page + 1))
+            pending += 1
+
+    for _ in processes:
+        tasks.put(None)
+    for process in processes:
+        process.join()
+
+    print(f"frontier {frontier.run_id}: {frontier.summary()}")
+    frontier.close()
+    return pd.concat(df_all) if df_all else pd.DataFrame()
 
 def get_localities(from_gdf=False):
     if from_gdf:
@@ -184,36 +591,22 @@ def get_listing_counts(localities, n_driver_reset=30):
 
 def collate_files():
     # db = DropboxAPI() # Removed DropboxAPI instantiation
-    source_directory = './data/domain/sales-selenium/'
-    # Ensure the source directory itself exists, though listdir won't fail if it's empty or doesn't exist (returns error)
-    if not os.path.exists(source_directory):
-        print(f"Source directory {source_directory} does not exist. No files to collate.")
+    if not os.path.exists(SALES_DATASET):
+        print(f"Dataset {SALES_DATASET} does not exist. No partitions to collate.")
         return
 
-    files = [f for f in os.listdir(source_directory) if f.endswith('.csv') and not os.path.basename(f).startswith('collated_sales') and not os.path.basename(f).startswith('domain-listing-counts') and 'errors' not in f]
-    
-    if not files:
-        print(f"No CSV files found in {source_directory} to collate.")
+    # Only pages scraped since the last run are read; earlier pages are already in the manifest
+    new_partitions = ingest_partitions(SALES_DATASET)
+    if not new_partitions:
+        print(f"No new partitions found in {SALES_DATASET} to collate.")
         return
 
-    all_files_data = []
-    for file_name in files:
-        file_path = os.path.join(source_directory, file_name)
-        try:
-            all_files_data.append(pd.read_csv(file_path))
-        except Exception as e:
-            print(f"Error reading {file_path}: {e}")
-            
-    if not all_files_data:
-        print("No dataframes to concatenate.")
-        return
+    rows = sum(entry['rows'] for entry in new_partitions.values())
+    print(f"Collated {len(new_partitions)} partitions ({rows} rows) into {SALES_DATASET}")
 
-    df = pd.concat(all_files_data, ignore_index=True) # Use ignore_index=True if original indices are not important
-    
-    collated_file_path = os.path.join(source_directory, 'collated_sales.csv')
-    ensure_dir(collated_file_path) # ensure_dir will handle the directory part
-    df.to_csv(collated_file_path, index=False)
-    print(f"Collated data saved to {collated_file_path}")
+    # Marks only move once the pages behind them are in the manifest
+    watermarks = advance_watermarks(new_partitions)
+    print(f"Watermarks updated for {len(watermarks)} localities")
     return
 
 def get_latest_sales():
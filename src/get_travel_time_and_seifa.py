@@ -3,75 +3,189 @@ from dotenv import load_dotenv
 import googlemaps
 import pandas as pd
 import geopandas as gpd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import sqlite3
+import pytz
+
+from src.utils.ratelimit import TokenBucket
+
 load_dotenv()
-gmaps = googlemaps.Client(key=os.getenv("GPLACES_API_KEY"))
 
-def load_geo_data():
-    gdf = gpd.read_feather('../data/geo/gdf_metro.feather')
-    gdf['suburb'] = gdf['suburb'].apply(lambda x: x.title())
+COMMUTE_DESTINATIONS = {
+    'train_to_finity': ("68 Harrington Street THE ROCKS NSW 2000", "transit"),
+    'drive_to_padstow': ("2 Blanche Avenue Padstow NSW 2211", "driving"),
+    'drive_to_kogarah': ("133 Harrow Rd, Kogarah NSW 2217", "driving"),
+    'drive_to_tkmaxx': ("189 O'Riordan St, Mascot NSW 2020", "driving"),
+}
+
+# Distance Matrix limits: 25 origins or destinations and 100 elements per request
+MATRIX_MAX_SIDE = 25
+MATRIX_MAX_ELEMENTS = 100
+MATRIX_ELEMENT_RATE = float(os.getenv('DISTANCE_MATRIX_RATE', 100))
+MATRIX_WORKERS = 8
+DURATION_CACHE_PATH = './data/cache/distance-matrix.sqlite'
+
+# Commutes are costed for the Monday morning peak rather than whenever the script happens to run
+DEPARTURE_WEEKDAY = 0
+DEPARTURE_HOUR = 8
+
+timezone = pytz.timezone('Australia/Sydney')
+gmaps = None
+
+def maps_client():
+    global gmaps
+    if gmaps is None:
+        gmaps = googlemaps.Client(key=os.getenv("GPLACES_API_KEY"))
+    return gmaps
+
+def load_geo_data(path='./data/geo/gdf_metro.feather'):
+    gdf = gpd.read_feather(path)
+    gdf['suburb'] = gdf['suburb'].str.title()
     gdf['key'] = gdf['suburb'] + " - " + gdf['postcode'].astype(str)
     gdf = gdf.to_crs('EPSG:3857')
     gdf['centroid'] = gdf['geometry'].centroid.to_crs('EPSG:4326')
     gdf.set_index('key', inplace=True)
     return gdf.to_crs('EPSG:4326') 
 
-def get_travel_time(origin, destination, mode):
-    try:
-        directions_result = gmaps.directions(origin, destination, mode=mode, departure_time="now")
-        if len(directions_result) > 0:
-            travel_time_text = directions_result[0]['legs'][0]['duration']['text']
-            travel_time_value = directions_result[0]['legs'][0]['duration']['value']
-            if "hour" in travel_time_text:
-                # Convert hours to minutes
-                hours = int(travel_time_text.split(" hour")[0])
-                minutes = int(travel_time_text.split(" hour ")[1].split(" min")[0])
-                travel_time_minutes = hours * 60 + minutes
-            else:
-                # Travel time is given in minutes
-                travel_time_minutes = int(travel_time_value / 60)
-            return travel_time_minutes
-        else:
-            return None
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        return None
-
-def get_duration_batch(destination, mode, coordinates_list):
-    result = []
-    for i, coordinates in enumerate(coordinates_list):
-        duration = get_travel_time(coordinates, destination, mode)
-        result.append(duration)
-        print(f"{i}: {duration}")
-    return result
-
-def attach_durations():
-    gdf = load_geo_data()
+def departure_time(weekday=DEPARTURE_WEEKDAY, hour=DEPARTURE_HOUR, now=None):
+    """Next departure on the given weekday and hour, and the bucket its results are cached under."""
+    now = now or datetime.now(timezone)
+    day = now.date() + timedelta(days=(weekday - now.weekday()) % 7)
+    if (day, hour) <= (now.date(), now.hour):
+        day += timedelta(days=7)
+    departure = timezone.localize(datetime(day.year, day.month, day.day, hour))
+    return departure, departure.strftime('%a %H:%M')
+
+def location_key(location):
+    if isinstance(location, (list, tuple)):
+        return f"{location[0]:.6f},{location[1]:.6f}"
+    return location
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+class DurationCache:
+    """Travel times in seconds keyed by (origin, destination, mode, departure bucket); None marks no route."""
+
+    def __init__(self, path=DURATION_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS durations (origin TEXT, destination TEXT, mode TEXT, bucket TEXT, seconds INTEGER, "
+            "PRIMARY KEY (origin, destination, mode, bucket))")
+
+    def load(self, mode, bucket):
+        rows = self.connection.execute(
+            "SELECT origin, destination, seconds FROM durations WHERE mode = ? AND bucket = ?", (mode, bucket))
+        return {(origin, destination): seconds for origin, destination, seconds in rows}
+
+    def store(self, mode, bucket, durations):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO durations (origin, destination, mode, bucket, seconds) VALUES (?, ?, ?, ?, ?)",
+                [(origin, destination, mode, bucket, seconds) for (origin, destination), seconds in durations.items()])
+
+class CommuteEngine:
+    """Origin x destination travel times from batched Distance Matrix requests, fetched concurrently.
+
+    Only pairs missing from the cache are requested, so adding a destination costs one pass over the
+    origins and a re-run costs nothing. `client` is anything with googlemaps' distance_matrix method.
+    """
+
+    def __init__(self, client=None, cache=None, workers=MATRIX_WORKERS, element_rate=MATRIX_ELEMENT_RATE):
+        self.client = client or maps_client()
+        self.cache = cache or DurationCache()
+        self.workers = workers
+        # Quota is counted in elements, so each request takes one token per origin-destination pair
+        self.rate_limiter = TokenBucket(element_rate, capacity=max(element_rate, MATRIX_MAX_ELEMENTS))
+
+    def request(self, origins, destinations, mode, departure):
+        self.rate_limiter.acquire(len(origins) * len(destinations))
+        # Passed as a unix time since googlemaps reads datetimes in the machine's local zone
+        response = self.client.distance_matrix(origins, destinations, mode=mode, departure_time=int(departure.timestamp()))
+
+        durations = {}
+        for origin, row in zip(origins, response['rows']):
+            for destination, element in zip(destinations, row['elements']):
+                # NOT_FOUND and ZERO_RESULTS will not change on a retry, so they are cached as None
+                seconds = element['duration']['value'] if element['status'] == 'OK' else None
+                durations[(location_key(origin), destination)] = seconds
+        return durations
+
+    def batches(self, origins, destinations, known):
+        # Destinations missing the same origins share requests; usually that is all new ones together
+        groups = {}
+        for destination in destinations:
+            missing = tuple(origin for origin in origins if (location_key(origin), destination) not in known)
+            if missing:
+                groups.setdefault(missing, []).append(destination)
+
+        for missing, group in groups.items():
+            for destination_chunk in chunks(group, MATRIX_MAX_SIDE):
+                origin_size = min(MATRIX_MAX_SIDE, MATRIX_MAX_ELEMENTS // len(destination_chunk))
+                for origin_chunk in chunks(list(missing), origin_size):
+                    yield origin_chunk, destination_chunk
+
+    def durations(self, origins, destinations, departure=None, bucket=None):
+        """Minutes from each origin to each destination, as {column: [minutes per origin]}."""
+        if departure is None:
+            departure, bucket = departure_time()
+        bucket = bucket or departure.strftime('%a %H:%M')
+        known_by_mode = {}
+
+        for mode in sorted({mode for _, mode in destinations.values()}):
+            mode_destinations = sorted({address for address, address_mode in destinations.values() if address_mode == mode})
+            known = self.cache.load(mode, bucket)
+            batches = list(self.batches(origins, mode_destinations, known))
+            print(f"{mode}: {len(batches)} requests for {len(origins)} origins x {len(mode_destinations)} destinations")
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self.request, origin_chunk, destination_chunk, mode, departure) for origin_chunk, destination_chunk in batches]
+                for future in as_completed(futures):
+                    try:
+                        durations = future.result()
+                    except Exception as e:
+                        # Failed requests are not cached, so the next run asks again
+                        print(f"Error: {str(e)}")
+                        continue
+                    self.cache.store(mode, bucket, durations)
+                    known.update(durations)
+            known_by_mode[mode] = known
+
+        result = {}
+        for column, (address, mode) in destinations.items():
+            seconds = [known_by_mode[mode].get((location_key(origin), address)) for origin in origins]
+            result[column] = [int(value / 60) if value is not None else None for value in seconds]
+        return result
+
+def commute_durations(gdf, engine=None, destinations=COMMUTE_DESTINATIONS):
     coordinates_list = [(point.y, point.x) for point in gdf['centroid']]
-    
-    train_to_finity = get_duration_batch("68 Harrington Street THE ROCKS NSW 2000", "transit", coordinates_list)
-    drive_to_padstow = get_duration_batch("2 Blanche Avenue Padstow NSW 2211", "driving", coordinates_list)
-    drive_to_kogarah = get_duration_batch("133 Harrow Rd, Kogarah NSW 2217", "driving", coordinates_list)
-    drive_to_tkmaxx = get_duration_batch("189 O'Riordan St, Mascot NSW 2020", "driving", coordinates_list)
-    
-    gdf['train_to_finity'] = train_to_finity
-    gdf['drive_to_padstow'] = drive_to_padstow
-    gdf['drive_to_kogarah'] = drive_to_kogarah
-    gdf['drive_to_tkmaxx'] = drive_to_tkmaxx
-
-    path_out = '../data/geo/gdf_with_durations.feather'
+    engine = engine or CommuteEngine()
+    return pd.DataFrame(engine.durations(coordinates_list, destinations), index=gdf.index)
+
+def attach_durations(engine=None, destinations=COMMUTE_DESTINATIONS):
+    gdf = load_geo_data()
+    for column, minutes in commute_durations(gdf, engine, destinations).items():
+        gdf[column] = minutes
+
+    path_out = './data/geo/gdf_with_durations.feather'
     gdf.to_feather(path_out)
     print(f"gdf saved: {path_out}")
 
+def merge_seifa(gdf, df_seifa):
+    gdf2 = gdf.merge(df_seifa, on='suburb', how='left')
+    # Impute missing SEIFA values with the postcode average
+    gdf2['seifa'] = gdf2['seifa'].fillna(gdf2.groupby('postcode')['seifa'].transform('mean'))
+    return gdf2
+
 def attach_seifa():
         
     gdf = gpd.read_feather('./data/geo/gdf_with_durations.feather')
     df_seifa = pd.read_excel('./data/geo/seifa.xlsx', sheet_name='processed')
 
-    gdf2 = gdf.merge(df_seifa, on='suburb', how='left')
-    postcode_means = gdf2.groupby('postcode')['seifa'].mean()
-
-    # Impute missing SEIFA values with the postcode average
-    gdf2['seifa'] = gdf2.apply(lambda row: postcode_means[row['postcode']] if pd.isna(row['seifa']) else row['seifa'], axis=1)
+    gdf2 = merge_seifa(gdf, df_seifa)
 
     gdf2['key'] = gdf2['suburb'] + " - " + gdf2['postcode'].astype(str)
     gdf2.set_index('key', inplace=True)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+def lerp(lower, upper, fraction):
+    # Same interpolation as np.quantile so results match Series.quantile
+    diff = upper - lower
+    return np.where(fraction >= 0.5, upper - diff * (1 - fraction), lower + diff * fraction)
+
+def group_quantiles(keys, values, percentiles, round_digits=None, index_name='key'):
+    """Percentiles of values for every key in one sort, returned as one column per percentile plus 'count'."""
+    codes, uniques = pd.factorize(keys, sort=True)
+    values = np.asarray(values, dtype='float64')
+
+    # Count every row with a key, but only rank the non-null values
+    has_key = codes >= 0
+    counts = np.bincount(codes[has_key], minlength=len(uniques))
+    ranked = has_key & ~np.isnan(values)
+    codes, values = codes[ranked], values[ranked]
+
+    order = np.lexsort((values, codes))
+    # Categorical keys factorise to a CategoricalIndex; summaries are joined on a plain index
+    return sorted_group_quantiles(codes[order], values[order], counts, percentiles, round_digits, pd.Index(np.asarray(uniques), name=index_name))
+
+def sorted_group_quantiles(codes, sorted_values, counts, percentiles, round_digits=None, index=None):
+    """Percentiles from non-null values already sorted by (code, value); counts are the rows per code."""
+    n_groups = len(counts)
+    sizes = np.bincount(codes, minlength=n_groups)
+    starts = np.cumsum(sizes) - sizes
+    empty = sizes == 0
+    last = np.maximum(sizes - 1, 0)
+
+    result = {}
+    for q in percentiles:
+        position = q * last
+        lower = np.floor(position).astype('int64')
+        upper = np.minimum(lower + 1, last)
+        fraction = position - lower
+        if len(sorted_values):
+            lower_values = sorted_values[np.where(empty, 0, starts + lower)]
+            upper_values = sorted_values[np.where(empty, 0, starts + upper)]
+            column = np.where(empty, np.nan, lerp(lower_values, upper_values, fraction))
+        else:
+            column = np.full(n_groups, np.nan)
+        if round_digits is not None:
+            column = np.round(column, round_digits)
+        result[q] = column
+
+    summary = pd.DataFrame(result, index=index)
+    summary['count'] = counts
+    return summary
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+INDEX_COLUMNS = ['home_type', 'beds', 'baths', 'parking']
+# Missing dates sort after every real day, so no date range selects them
+MISSING_DAY = np.iinfo(np.int32).max
+
+def day_number(value):
+    return pd.Timestamp(value).to_datetime64().astype('datetime64[D]').astype('int64')
+
+def day_numbers(dates):
+    """datetime64 values as int32 days since the epoch."""
+    days = dates.astype('datetime64[D]')
+    return np.where(np.isnat(days), MISSING_DAY, days.astype('int64')).astype(np.int32)
+
+class IndexedFrame:
+    """Rows sorted by date (as int32 day numbers) with a packed bitmap per value of each filter column."""
+
+    def __init__(self, keys, prices, dates, bitmaps):
+        self.keys = keys
+        self.prices = prices
+        self.dates = dates
+        self.bitmaps = bitmaps
+
+    def __len__(self):
+        return len(self.prices)
+
+    def date_slice(self, date_range=None):
+        if date_range is None or self.dates is None:
+            return 0, len(self)
+        start = np.searchsorted(self.dates, day_number(date_range[0]), side='left')
+        stop = np.searchsorted(self.dates, day_number(date_range[1]), side='right')
+        return start, max(start, stop)
+
+    def column_mask(self, column, condition, byte_start, byte_stop):
+        mask = np.zeros(byte_stop - byte_start, dtype=np.uint8)
+        for value in condition:
+            bitmap = self.bitmaps[column].get('nan' if pd.isna(value) else value)
+            if bitmap is not None:
+                mask |= bitmap[byte_start:byte_stop]
+        return mask
+
+    def select_rows(self, date_range=None, home_type=None, beds=None, baths=None, parking=None):
+        start, stop = self.date_slice(date_range)
+        filters = {'home_type': home_type, 'beds': beds, 'baths': baths, 'parking': parking}
+        filters = {column: condition for column, condition in filters.items() if condition is not None}
+        if not filters:
+            return np.arange(start, stop)
+
+        # AND the packed bitmaps over the bytes covering the date slice, unpack once at the end
+        byte_start, byte_stop = start // 8, -(-stop // 8)
+        mask = None
+        for column, condition in filters.items():
+            column_mask = self.column_mask(column, condition, byte_start, byte_stop)
+            mask = column_mask if mask is None else mask & column_mask
+
+        bits = np.unpackbits(mask, count=stop - byte_start * 8)[start - byte_start * 8:]
+        return start + np.flatnonzero(bits)
+
+    def select(self, date_range=None, **filters):
+        rows = self.select_rows(date_range=date_range, **filters)
+        return pd.DataFrame({'key': self.keys[rows], 'price': self.prices[rows]})
+
+def column_values(column, order):
+    """A column's values in the given order; categorical and nullable columns stay as compact extension arrays."""
+    if isinstance(column.dtype, pd.api.extensions.ExtensionDtype):
+        return column.array[order]
+    return column.to_numpy()[order]
+
+def build_bitmaps(values):
+    # Factorising handles object, categorical and nullable integer columns alike
+    codes, uniques = pd.factorize(values)
+    bitmaps = {}
+    if (codes < 0).any():
+        bitmaps['nan'] = np.packbits(codes < 0)
+    for code, value in enumerate(uniques):
+        bitmaps[value] = np.packbits(codes == code)
+    return bitmaps
+
+def build_indexed_frame(df, date_col='date_sold', index_columns=INDEX_COLUMNS):
+    if date_col in df.columns:
+        dates = day_numbers(df[date_col].to_numpy(dtype='datetime64[ns]'))
+        order = np.argsort(dates, kind='stable')
+        dates = dates[order]
+    else:
+        dates = None
+        order = np.arange(len(df))
+
+    return IndexedFrame(
+        keys=column_values(df['key'], order),
+        prices=df['price'].to_numpy()[order],
+        dates=dates,
+        bitmaps={column: build_bitmaps(column_values(df[column], order)) for column in index_columns},
+    )
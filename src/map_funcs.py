@@ -1,6 +1,7 @@
 
 import geopandas as gpd
 import pandas as pd
+import numpy as np
 import folium
 from folium.features import GeoJsonTooltip
 from branca.colormap import linear
@@ -8,6 +9,48 @@ import warnings
 import os
 import re
 
+from src.utils.snapshot import load_snapshot
+from src.price_cube import PriceCube
+from src.indexed_frame import IndexedFrame
+from src.group_quantiles import group_quantiles
+from src.suburb_index import build_suburb_index, assign_suburbs
+from src.utils.profiling import profiled
+from src.utils.listing_store import read_listings, MANIFEST_FILE
+
+SALES_PATH = './data/domain/sales.csv'
+# Partitioned listings written by the sold-listings scraper; read in place of SALES_PATH once ingested
+SALES_DATASET = './data/domain/sales-selenium/dataset/'
+SALES_MANIFEST_PATH = os.path.join(SALES_DATASET, MANIFEST_FILE)
+RENT_PATH = './data/domain/rent.csv'
+GEO_PATH = './data/geo/gdf_final.feather'
+SIMPLIFIED_GEO_PATH = './data/geo/gdf_simplified.feather'
+SCHOOLS_PATH = './data/geo/naplan-scores-2022.xlsx'
+SUBURB_MAP_PATH = './data/geo/suburb_pc.csv'
+
+# Bump when the cleaning logic changes so existing snapshots are rebuilt
+SNAPSHOT_VERSION = 3
+
+# Categorical strings, nullable uint8 counts and int32 prices for the cached listing frames;
+# set HOMERUN_COMPACT_FRAMES=0 to keep the plain object/float64 columns
+COMPACT_FRAMES = os.getenv('HOMERUN_COMPACT_FRAMES', '1') != '0'
+LISTINGS_SNAPSHOT_VERSION = f"{SNAPSHOT_VERSION}-compact" if COMPACT_FRAMES else SNAPSHOT_VERSION
+CATEGORY_COLUMNS = ['key', 'suburb', 'home_type']
+COUNT_COLUMNS = ['beds', 'baths', 'parking']
+
+DEFAULT_PERCENTILES = [0.10, 0.25, 0.50, 0.75, 0.90]
+PERCENTILE_COLUMNS = {0.10: 'price_p10', 0.25: 'price_q1', 0.50: 'median_price', 0.75: 'price_q3', 0.90: 'price_p90'}
+
+TOOLTIP_FIELDS = ['key', 'price_p10', 'price_q1', 'median_price', 'price_q3', 'price_p90', 'properties', 
+                  'median_rent', 'rental_properties', 'yield_median', 
+                  'decile_public_average', 'decile_public_max', 'schools', 'seifa', 'train_to_finity', 'drive_to_padstow', 'drive_to_kogarah', 'drive_to_tkmaxx']
+TOOLTIP_ALIASES = ['Suburb: ', 'P10 Price', 'Q1 Price', 'Median Price: ', 'Q3 Price', 'P90 Price', 'Properties Sold: ', 
+                   'Median Rent', 'Rental Properties', 'Median Yield', 
+                   'Decile Public Avg: ', 'Decile Public Max: ', 'Schools: ', 'SEIFA: ', 'Finity: ', 'Padstow ', 'Kogarah ', 'TK: ']
+# (maximum suburbs on the map, geometry column): coarser outlines as more of the city is shown
+GEOMETRY_LEVELS = [(150, 'geometry'), (500, 'geometry_lod1'), (1500, 'geometry_lod2'), (None, 'geometry_lod3')]
+
+HEX_BYTES = np.array([f'{i:02x}' for i in range(256)])
+
 warnings.filterwarnings('ignore', 'Geometry is in a geographic CRS', UserWarning)
 
 def clean_home_type(df):
@@ -34,16 +77,15 @@ def clean_home_type(df):
 def clean_fields(df):
     
     # Locality
-    df['suburb'] = df['suburb'].apply(lambda x: x.title())
+    df['suburb'] = df['suburb'].str.title()
     df.loc[df['suburb'] == 'Mcmahons Point', 'suburb'] = 'North Sydney'
     df['key'] = df['suburb'] + " - " + df['postcode'].astype(int).astype(str)
     df['key'] = df['key'].astype(str)
     
     # Beds, bath parking
-    df['beds'] = df['beds'].apply(lambda x: max(min(x, 5),1))
-    df['baths'] = df['baths'].apply(lambda x: max(min(x, 5), 1))
-    df['parking'].replace({"−": 0, pd.NA: 0}, inplace=True)
-    df['parking'] = df['parking'].apply(lambda x: min(x, 2))
+    df['beds'] = df['beds'].clip(1, 5)
+    df['baths'] = df['baths'].clip(1, 5)
+    df['parking'] = pd.to_numeric(df['parking'].replace("−", 0), errors='coerce').clip(upper=2)
     
     # Clean fields
     df['price'] = pd.to_numeric(df['price'], errors='coerce')
@@ -55,22 +97,60 @@ def clean_fields(df):
   
     return df
 
-def load_sales_data():
+def compact_frame(df):
+    """Shrink the cleaned listing columns; filters, groupbys and the sidebar options see the same values."""
+    if not COMPACT_FRAMES:
+        return df
+    dtypes = {column: 'category' for column in CATEGORY_COLUMNS if column in df.columns}
+    dtypes.update({column: 'UInt8' for column in COUNT_COLUMNS if column in df.columns})
+    # Sale prices are whole dollars and well under the int32 limit; anything larger stays float64
+    if df['price'].abs().max() < np.iinfo(np.int32).max and (df['price'] % 1 == 0).all():
+        dtypes['price'] = 'int32'
+    return df.astype(dtypes)
+
+def read_store_sales(root=SALES_DATASET):
+    """Scraped listings in the sales.csv layout, taking suburb and postcode from the partition's locality."""
+    df = read_listings(root)
+    if df.empty:
+        return None
+    # A listing fetched on several days keeps its latest copy
+    df = df.sort_values('partition_date', kind='stable')
+    df = df[df['link'].isna() | ~df.duplicated('link', keep='last')]
+    locality = df['partition_suburb'].str.rsplit('-', n=2, expand=True)
+    df['suburb'] = locality[0].str.replace('-', ' ')
+    df['postcode'] = pd.to_numeric(locality[2], errors='coerce')
+    for column in ['beds', 'baths']:
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    return df
+
+def sales_sources():
+    return [SALES_MANIFEST_PATH if os.path.exists(SALES_MANIFEST_PATH) else SALES_PATH, GEO_PATH]
+
+def load_sales_data(suburb_index=None):
     print("loading sales data")
-    df = pd.read_csv('./data/domain/sales.csv')
+    df = read_store_sales() if os.path.exists(SALES_MANIFEST_PATH) else None
+    if df is None:
+        df = pd.read_csv(SALES_PATH)
     df['date_sold'] = pd.to_datetime(df['date_sold'])
     df = clean_fields(df)
-    return clean_home_type(df)
+    df = assign_suburbs(df, suburb_index)
+    return compact_frame(clean_home_type(df))
 
 def load_geo_data():
     print("loading geo data")
-    gdf = gpd.read_feather('./data/geo/gdf_final.feather')
-    return gdf.drop(columns='centroid')
+    gdf = gpd.read_feather(GEO_PATH)
+    gdf = gdf.drop(columns='centroid')
+    
+    # Centroids are taken in a projected CRS once here rather than on every render
+    centroids = gdf.geometry.to_crs('EPSG:3857').centroid.to_crs('EPSG:4326')
+    gdf['centroid_lat'] = centroids.y
+    gdf['centroid_lng'] = centroids.x
+    return gdf
 
 def load_school_data():
     print("loading school data")
-    schools = pd.read_excel('data/geo/naplan-scores-2022.xlsx', sheet_name = 'final')
-    suburb_map = pd.read_csv('data/geo/suburb_pc.csv')
+    schools = pd.read_excel(SCHOOLS_PATH, sheet_name = 'final')
+    suburb_map = pd.read_csv(SUBURB_MAP_PATH)
     schools['suburb'] = schools['suburb'].apply(lambda x: re.sub(' North| South| East| West', '', x))
     schools = pd.merge(schools, suburb_map, how='left', on='suburb')
     schools = schools[~schools['postcode'].isna()]
@@ -80,26 +160,51 @@ def load_school_data():
     schools.set_index('key', inplace=True)
     return schools.drop(columns=['suburb', 'postcode', 'state', 'decile_diff'])
 
-def load_rent_data():
+def load_rent_data(suburb_index=None):
     print("loading rent data")
-    df = pd.read_csv('./data/domain/rent.csv')
+    df = pd.read_csv(RENT_PATH)
+
+    return compact_frame(assign_suburbs(clean_fields(df), suburb_index))
 
-    return clean_fields(df)
+def load_simplified_geo_data():
+    print("loading simplified geo data")
+    return gpd.read_feather(SIMPLIFIED_GEO_PATH)
 
-def load_data():
-    df = load_sales_data()
+def load_suburb_data():
     gdf = load_geo_data()
     schools = load_school_data()
-    df_rent = load_rent_data()
     
     gdf = gdf.join(schools, on='key', how='left')
     gdf = gdf.fillna(0)
     
+    if os.path.exists(SIMPLIFIED_GEO_PATH):
+        gdf = gdf.join(load_simplified_geo_data(), how='left')
+    return gdf
+
+def load_suburb_index():
+    print("building suburb index")
+    return build_suburb_index(gpd.read_feather(GEO_PATH))
+
+@profiled('load_data')
+def load_data(use_snapshot=True):
+    if not use_snapshot:
+        suburb_index = load_suburb_index()
+        return load_sales_data(suburb_index), load_suburb_data(), load_rent_data(suburb_index)
+
+    # Each frame is rebuilt only when its own source files change; listings depend on the
+    # suburb polygons too, since rows with coordinates are keyed by the polygon they fall in
+    suburb_index = load_snapshot('suburb_index', [GEO_PATH], load_suburb_index, version=SNAPSHOT_VERSION, fmt='pickle')
+    df = load_snapshot('sales', sales_sources(), lambda: load_sales_data(suburb_index), version=LISTINGS_SNAPSHOT_VERSION)
+    suburb_sources = [GEO_PATH, SCHOOLS_PATH, SUBURB_MAP_PATH] + ([SIMPLIFIED_GEO_PATH] if os.path.exists(SIMPLIFIED_GEO_PATH) else [])
+    gdf = load_snapshot('suburbs', suburb_sources, load_suburb_data, version=SNAPSHOT_VERSION, geo=True)
+    df_rent = load_snapshot('rent', [RENT_PATH, GEO_PATH], lambda: load_rent_data(suburb_index), version=LISTINGS_SNAPSHOT_VERSION)
+    
     # print(f"dim df: {df.shape}")
     # print(f"dim gdf: {gdf.shape}")
     
     return df, gdf, df_rent
 
+@profiled('prepare_gdf')
 def prepare_gdf(gdf, summary, summary_rent):
     gdf_comb = gdf.join(summary, how='left')
     gdf_comb = gdf_comb.join(summary_rent, how='left')
@@ -110,41 +215,76 @@ def prepare_gdf(gdf, summary, summary_rent):
     
     return gdf_comb.reset_index()
 
-def summarise_data(df, round_digits=-3, date_filter=True, date_range=None, home_type=None, beds=None, baths=None, parking=None, suffix=None):
+def percentile_column(q):
+    return PERCENTILE_COLUMNS.get(q, f"price_p{q * 100:g}")
+
+@profiled('summarise_data')
+def summarise_data(df, round_digits=-3, date_filter=True, date_range=None, home_type=None, beds=None, baths=None, parking=None, suffix=None, percentiles=DEFAULT_PERCENTILES):
     
     # df.to_csv(f'./temp/df_{suffix}_original.csv')
     
     # Applying filters based on the provided parameters
-    if date_filter and date_range is not None:
-        df = df.loc[(df['date_sold'] >= date_range[0]) & (df['date_sold'] <= date_range[1])]
-
-    filters = {'home_type': home_type, 'beds': beds, 'baths': baths, 'parking': parking}
-    for column, condition in filters.items():
-        if condition is not None:
-            df = df.loc[df[column].isin(condition)]
+    if isinstance(df, PriceCube):
+        # The cube merges its pre-sorted cells directly rather than handing rows to group_quantiles
+        summary = df.summarise(percentiles, round_digits=round_digits, date_range=date_range if date_filter else None, home_type=home_type, beds=beds, baths=baths, parking=parking)
+    else:
+        if isinstance(df, IndexedFrame):
+            df = df.select(date_range=date_range if date_filter else None, home_type=home_type, beds=beds, baths=baths, parking=parking)
+        else:
+            if date_filter and date_range is not None:
+                df = df.loc[(df['date_sold'] >= date_range[0]) & (df['date_sold'] <= date_range[1])]
 
-    # df.to_csv(f'./temp/df_{suffix}_filtered.csv')
+            filters = {'home_type': home_type, 'beds': beds, 'baths': baths, 'parking': parking}
+            for column, condition in filters.items():
+                if condition is not None:
+                    df = df.loc[df[column].isin(condition)]
 
-    # Group by 'key' and calculate the percentiles and count of records
-    summary = df.groupby('key').agg({
-        'price': [lambda x: x.quantile(0.10), lambda x: x.quantile(0.25), 'median', lambda x: x.quantile(0.75), lambda x: x.quantile(0.90)],
-        'key': 'count'
-    })
-    
+        # df.to_csv(f'./temp/df_{suffix}_filtered.csv')
 
-    # Rename and round the price columns
-    summary.columns = ['price_p10', 'price_q1','median_price', 'price_q3', 'price_p90', 'properties']
-    for col in ['price_p10', 'price_q1','median_price', 'price_q3', 'price_p90']:
-        summary[col] = summary[col].apply(lambda x: round(x, round_digits))
+        # Group by 'key' and calculate the percentiles and count of records in one sorted pass
+        summary = group_quantiles(df['key'], df['price'], percentiles, round_digits=round_digits)
+    summary.columns = [percentile_column(q) for q in percentiles] + ['properties']
 
     # summary.to_csv(f'./temp/df_{suffix}_summarised.csv')
     
     return summary
 
+def colormap_hex(colormap, values):
+    """Vectorised colormap(x) for a LinearColormap, giving the same '#rrggbbaa' strings."""
+    index = np.asarray(colormap.index, dtype='float64')
+    colors = np.asarray(colormap.colors, dtype='float64')
+    values = np.clip(np.asarray(values, dtype='float64'), index[0], index[-1])
+
+    upper = np.clip(np.searchsorted(index, values, side='left'), 1, len(index) - 1)
+    lower = upper - 1
+    width = index[upper] - index[lower]
+    p = np.where(width > 0, (values - index[lower]) / np.where(width > 0, width, 1), 1.0)[:, None]
+    rgba = ((1.0 - p) * colors[lower] + p * colors[upper]) * 255.9999
+
+    channels = HEX_BYTES[np.nan_to_num(rgba).astype(int)]
+    return np.char.add(np.char.add(np.char.add(np.char.add('#', channels[:, 0]), channels[:, 1]), channels[:, 2]), channels[:, 3])
+
+def style_columns(gdf_comb, colormap):
+    median_price = gdf_comb['median_price'].to_numpy(dtype='float64')
+    decile_public_average = gdf_comb['decile_public_average']
+    
+    return pd.DataFrame({
+        'fill_color': np.where(np.isnan(median_price), '#black', colormap_hex(colormap, median_price)),
+        'border_weight': np.where(decile_public_average.isin([9, 10]), 1, 0),
+        'border_color': np.where(decile_public_average.isin([8, 9, 10]), '#151515', '#000000'),
+    }, index=gdf_comb.index)
+
+def geometry_level(n_suburbs, columns):
+    for max_suburbs, column in GEOMETRY_LEVELS:
+        if column in columns and (max_suburbs is None or n_suburbs <= max_suburbs):
+            return column
+    return 'geometry'
+
+@profiled('plot_map')
 def plot_map(gdf_comb):
     
     # Base map
-    m = folium.Map(location=[gdf_comb.geometry.centroid.y.mean(), gdf_comb.geometry.centroid.x.mean()], zoom_start=12)
+    m = folium.Map(location=[gdf_comb['centroid_lat'].mean(), gdf_comb['centroid_lng'].mean()], zoom_start=12)
     
     # Colour Map
     colormap = linear.YlOrRd_09.scale(800000, 2500000)
@@ -152,47 +292,46 @@ def plot_map(gdf_comb):
     m.add_child(colormap)
 
     # Define tooltip
-    tooltip = GeoJsonTooltip(
-        fields=['key', 'price_p10', 'price_q1', 'median_price', 'price_q3', 'price_p90', 'properties', 
-                'median_rent', 'rental_properties', 'yield_median', 
-                'decile_public_average', 'decile_public_max', 'schools', 'seifa', 'train_to_finity', 'drive_to_padstow', 'drive_to_kogarah', 'drive_to_tkmaxx'],
-        aliases=['Suburb: ', 'P10 Price', 'Q1 Price', 'Median Price: ', 'Q3 Price', 'P90 Price', 'Properties Sold: ', 
-                 'Median Rent', 'Rental Properties', 'Median Yield', 
-                 'Decile Public Avg: ', 'Decile Public Max: ', 'Schools: ', 'SEIFA: ', 'Finity: ', 'Padstow ', 'Kogarah ', 'TK: '],
-        localize=True
-    )
-
-    # Function to return color given feature
-    def style_function(feature):
-        median_price = feature['properties']['median_price']
-        decile_public_average = feature['properties']['decile_public_average']
+    tooltip = GeoJsonTooltip(fields=TOOLTIP_FIELDS, aliases=TOOLTIP_ALIASES, localize=True)
 
-        border_color = '#151515' if decile_public_average in [8, 9, 10] else '#000000'
-        border_weight = 1 if decile_public_average in [9, 10] else 0
-
-        return {
-            'fillOpacity': 0.3,
-            'weight': border_weight,
-            'color': border_color,
-            'fillColor': '#black' if median_price is None else colormap(median_price)
-        }
+    # Styles are precomputed per suburb and read from feature.properties.style in the browser,
+    # so folium never calls back into Python per feature
+    styles = style_columns(gdf_comb, colormap)
+    geometry_column = geometry_level(len(gdf_comb), gdf_comb.columns)
+    gdf_styled = gpd.GeoDataFrame(gdf_comb[TOOLTIP_FIELDS], geometry=gdf_comb[geometry_column].values, crs=gdf_comb.crs)
+    gdf_styled['style'] = [
+        {'fillOpacity': 0.3, 'weight': weight, 'color': color, 'fillColor': fill}
+        for fill, weight, color in zip(styles['fill_color'].tolist(), styles['border_weight'].tolist(), styles['border_color'].tolist())
+    ]
 
     # Add the colored layer
-    folium.GeoJson(gdf_comb, style_function=style_function, tooltip=tooltip).add_to(m)
+    folium.GeoJson(gdf_styled, tooltip=tooltip).add_to(m)
 
     return m
 
+@profiled('summarise_rent')
+def summarise_rent(df_rent, **kwargs):
+    summary_rent = summarise_data(df_rent, suffix='rent', round_digits=0, date_filter=False, **kwargs)
+    summary_rent.rename(columns=lambda col: 'rental_properties' if col == 'properties' else col.replace('price', 'rent'), inplace=True)
+    return summary_rent
+
+@profiled('filter_suburbs')
+def filter_suburbs(gdf, min_school_decile=0, max_train_time=float('inf'), max_drive_time_padstow=float('inf'), max_drive_time_kogarah=float('inf'), max_drive_time_tkmaxx=float('inf'), commute_minutes=None, max_commute_time=float('inf')):
+    mask = (
+        (gdf['decile_public_max'] >= min_school_decile) &
+        (gdf['train_to_finity'] <= max_train_time) &
+        (gdf['drive_to_padstow'] <= max_drive_time_padstow) &
+        (gdf['drive_to_kogarah'] <= max_drive_time_kogarah) &
+        (gdf['drive_to_tkmaxx'] <= max_drive_time_tkmaxx)
+    )
+    if commute_minutes is not None:
+        # Minutes are aligned to gdf's rows; suburbs with no route drop out
+        mask &= np.asarray(commute_minutes) <= max_commute_time
+    return gdf[mask]
+
 def summarise_and_plot(gdf, df, df_rent, **kwargs):
     summary = summarise_data(df, suffix='sales', **kwargs)
-    summary_rent = summarise_data(df_rent, suffix='rent', round_digits=0, date_filter=False, **kwargs)
-    summary_rent.rename(columns={
-        'median_price': 'median_rent',
-        'price_p10': 'rent_p10',
-        'price_q1': 'rent_q1',
-        'price_q3': 'rent_q3',
-        'price_p90': 'rent_p90',
-        'properties': 'rental_properties'
-    }, inplace=True)
+    summary_rent = summarise_rent(df_rent, **kwargs)
     
     gdf_comb = prepare_gdf(gdf, summary, summary_rent)
     
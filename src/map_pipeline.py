@@ -0,0 +1,104 @@
+import folium
+
+from src.map_funcs import summarise_data, summarise_rent, prepare_gdf, filter_suburbs, plot_map
+from src.map_stream import export_geometry, stream_map_html
+from src.utils.lru import BoundedLRU
+from src.utils.profiling import span
+
+def filter_key(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(sorted(value))
+    return value
+
+class MapPipeline:
+    """Summarise -> join -> suburb filter -> render, each stage memoised on its own inputs only.
+
+    map_mode 'folium' renders a full folium page; 'stream' sends the suburb outlines once as a
+    static file and renders only a small attribute table per filter combination.
+    """
+
+    def __init__(self, gdf, sales, rent, stage_entries=16, map_entries=64, map_bytes=None, map_mode='folium', travel_matrix=None):
+        self.gdf = gdf
+        self.sales = sales
+        self.rent = rent
+        self.map_mode = map_mode
+        self.travel_matrix = travel_matrix
+        self.geometry_url = export_geometry(gdf) if map_mode == 'stream' else None
+        self.stages = {
+            'sales': BoundedLRU(max_entries=stage_entries),
+            'rent': BoundedLRU(max_entries=stage_entries),
+            'join': BoundedLRU(max_entries=stage_entries),
+            'suburbs': BoundedLRU(max_entries=stage_entries),
+            'map': BoundedLRU(max_entries=map_entries, max_bytes=map_bytes, sizeof=len),
+        }
+
+    def memoise(self, stage, key, func, *args, **kwargs):
+        cache = self.stages[stage]
+        result = cache.get(key)
+        if result is None:
+            result = func(*args, **kwargs)
+            cache.put(key, result)
+        return result
+
+    def sales_summary(self, date_range, home_type, beds, baths, parking):
+        key = (tuple(date_range), filter_key(home_type), filter_key(beds), filter_key(baths), filter_key(parking))
+        summary = self.memoise('sales', key, summarise_data, self.sales, suffix='sales', date_range=date_range, home_type=home_type, beds=beds, baths=baths, parking=parking)
+        return key, summary
+
+    def rent_summary(self, home_type, beds, baths, parking):
+        # Rent is not filtered by date so the date range is not part of its key
+        key = (filter_key(home_type), filter_key(beds), filter_key(baths), filter_key(parking))
+        summary = self.memoise('rent', key, summarise_rent, self.rent, home_type=home_type, beds=beds, baths=baths, parking=parking)
+        return key, summary
+
+    def joined(self, date_range, home_type, beds, baths, parking):
+        sales_key, summary = self.sales_summary(date_range, home_type, beds, baths, parking)
+        rent_key, summary_rent = self.rent_summary(home_type, beds, baths, parking)
+        key = (sales_key, rent_key)
+        return key, self.memoise('join', key, prepare_gdf, self.gdf, summary, summary_rent)
+
+    def filtered(self, date_range, home_type, beds, baths, parking, suburb_filters):
+        join_key, gdf_comb = self.joined(date_range, home_type, beds, baths, parking)
+        key = (join_key, tuple(sorted(suburb_filters.items())))
+        return key, self.memoise('suburbs', key, self.filter_suburbs, gdf_comb, suburb_filters)
+
+    def filter_suburbs(self, gdf_comb, suburb_filters):
+        suburb_filters = dict(suburb_filters)
+        destination = suburb_filters.pop('commute_destination', None)
+        mode = suburb_filters.pop('commute_mode', None)
+        if destination is not None and self.travel_matrix is not None:
+            suburb_filters['commute_minutes'] = self.travel_matrix.minutes_to(destination, mode).reindex(gdf_comb['key']).values
+
+        # Renumber so feature ids match a join done on the pre-filtered frame
+        return filter_suburbs(gdf_comb, **suburb_filters).reset_index(drop=True)
+
+    def render_html(self, gdf_comb):
+        if self.map_mode == 'stream':
+            return stream_map_html(self.geometry_url, gdf_comb)
+
+        map_element = plot_map(gdf_comb)
+        folium.LayerControl().add_to(map_element)
+        with span('figure_render'):
+            return folium.Figure().add_child(map_element).render()
+
+    def render(self, date_range, home_type, beds, baths, parking, suburb_filters):
+        # Checking the final stage first keeps repeated filter combinations to one lookup
+        key = (tuple(date_range), filter_key(home_type), filter_key(beds), filter_key(baths), filter_key(parking), tuple(sorted(suburb_filters.items())))
+        map_html = self.stages['map'].get(key)
+        if map_html is not None:
+            return map_html
+
+        _, gdf_filtered = self.filtered(date_range, home_type, beds, baths, parking, suburb_filters)
+        map_html = self.render_html(gdf_filtered)
+        self.stages['map'].put(key, map_html)
+        return map_html
+
+    def stats(self):
+        return {stage: cache.stats() for stage, cache in self.stages.items()}
+
+    def hit_rates(self):
+        rates = {}
+        for stage, stats in self.stats().items():
+            lookups = stats['hits'] + stats['misses']
+            rates[stage] = round(stats['hits'] / lookups, 3) if lookups else None
+        return rates
@@ -0,0 +1,122 @@
+from string import Template
+import geopandas as gpd
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+
+from src.map_funcs import TOOLTIP_FIELDS, TOOLTIP_ALIASES, style_columns
+from branca.colormap import linear
+
+# Served by Streamlit from ./static when server.enableStaticServing is on
+STATIC_DIR = './static'
+STATIC_URL = 'app/static'
+STREAM_GEOMETRY_LEVELS = ['geometry_lod1', 'geometry']
+
+LEAFLET_JS = 'https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js'
+LEAFLET_CSS = 'https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css'
+
+STREAM_TEMPLATE = Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8"/>
+<link rel="stylesheet" href="$leaflet_css"/>
+<script src="$leaflet_js"></script>
+<style>
+html, body, #map {height: 100%; margin: 0;}
+.legend {background: white; padding: 6px 8px; font: 12px sans-serif; border-radius: 4px;}
+.legend .bar {width: 240px; height: 10px; background: linear-gradient(to right, $gradient);}
+.legend .labels {display: flex; justify-content: space-between;}
+</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+var table = $table;
+var map = L.map('map').setView($center, $zoom);
+L.tileLayer('https://tile.openstreetmap.org/{z}/{x}/{y}.png', {
+    maxZoom: 19, attribution: '&copy; OpenStreetMap contributors'
+}).addTo(map);
+
+var legend = L.control({position: 'topright'});
+legend.onAdd = function() {
+    var div = L.DomUtil.create('div', 'legend');
+    div.innerHTML = '<div>' + table.caption + '</div><div class="bar"></div><div class="labels"><span>'
+        + table.vmin.toLocaleString() + '</span><span>' + table.vmax.toLocaleString() + '</span></div>';
+    return div;
+};
+legend.addTo(map);
+
+function tooltip(row) {
+    var html = '<table>';
+    for (var i = 0; i < table.fields.length; i++) {
+        var value = row[i] === null ? '' : (typeof row[i] === 'number' ? row[i].toLocaleString() : row[i]);
+        html += '<tr><th>' + table.aliases[i] + '</th><td>' + value + '</td></tr>';
+    }
+    return html + '</table>';
+}
+
+// Geometry has a content-hashed URL, so after the first load it comes from the browser cache
+fetch('$geometry_url', {cache: 'force-cache'}).then(function(response) {
+    return response.json();
+}).then(function(geometry) {
+    var n = table.fields.length;
+    L.geoJSON(geometry, {
+        filter: function(feature) { return feature.id in table.rows; },
+        style: function(feature) {
+            var row = table.rows[feature.id];
+            return {fillOpacity: 0.3, fillColor: row[n], weight: row[n + 1], color: row[n + 2]};
+        },
+        onEachFeature: function(feature, layer) {
+            layer.bindTooltip(tooltip(table.rows[feature.id]), {sticky: true});
+        }
+    }).addTo(map);
+});
+</script>
+</body>
+</html>
+""")
+
+def export_geometry(gdf, static_dir=STATIC_DIR):
+    """Write suburb outlines (id = key, no properties) once and return their static URL."""
+    geometry_column = next(column for column in STREAM_GEOMETRY_LEVELS if column in gdf.columns)
+    outlines = gpd.GeoDataFrame(index=gdf.index.astype(str), geometry=gdf[geometry_column].values, crs=gdf.crs)
+    geojson = outlines.to_json(drop_id=False)
+
+    file_name = f"suburbs-{hashlib.sha1(geojson.encode()).hexdigest()[:12]}.json"
+    file_path = os.path.join(static_dir, file_name)
+    if not os.path.exists(file_path):
+        os.makedirs(static_dir, exist_ok=True)
+        with open(file_path, 'w') as file:
+            file.write(geojson)
+    return f"{STATIC_URL}/{file_name}"
+
+def attribute_table(gdf_comb, colormap):
+    """Tooltip values plus fill colour, border weight and border colour for each visible suburb."""
+    styles = style_columns(gdf_comb, colormap)
+    attributes = pd.concat([gdf_comb[TOOLTIP_FIELDS], styles], axis=1)
+    attributes = attributes.astype(object).where(attributes.notna(), None)
+    return {
+        'fields': TOOLTIP_FIELDS,
+        'aliases': TOOLTIP_ALIASES,
+        'caption': colormap.caption,
+        'vmin': colormap.vmin,
+        'vmax': colormap.vmax,
+        'rows': dict(zip(gdf_comb['key'].astype(str), attributes.values.tolist())),
+    }
+
+def stream_map_html(geometry_url, gdf_comb, zoom=12):
+    colormap = linear.YlOrRd_09.scale(800000, 2500000)
+    colormap.caption = 'Median Price'
+    gradient = ', '.join(colormap.rgb_hex_str(x) for x in np.linspace(colormap.vmin, colormap.vmax, len(colormap.colors)))
+
+    return STREAM_TEMPLATE.substitute(
+        leaflet_js=LEAFLET_JS,
+        leaflet_css=LEAFLET_CSS,
+        gradient=gradient,
+        table=json.dumps(attribute_table(gdf_comb, colormap), separators=(',', ':')),
+        center=json.dumps([gdf_comb['centroid_lat'].mean(), gdf_comb['centroid_lng'].mean()]),
+        zoom=zoom,
+        geometry_url=geometry_url,
+    )
@@ -0,0 +1,224 @@
+import numpy as np
+import pandas as pd
+
+from src.indexed_frame import day_number, day_numbers
+from src.group_quantiles import sorted_group_quantiles, lerp
+
+CUBE_DIMENSIONS = ['home_type', 'beds', 'baths', 'parking']
+# Merging a cell by rank costs about as much as this many rows of the sort-free row pass, so
+# the cells are merged only when they hold thousands of rows each
+RANK_SELECT_CELL_COST = 4096
+
+class PriceCube:
+    """Prices bucketed by (key, month, home_type, beds, baths, parking), each cell a sorted price array.
+
+    Each row carries `cell * (len(uniques) + 1) + price rank`, which increases through the whole array,
+    so one searchsorted counts the prices at or below a value in any number of cells at once. A second
+    copy of the prices sorted by (key, price) serves selections too sparse for merging cells to pay off.
+    """
+
+    def __init__(self, cells, dimensions, ranked, dates, uniques, key_values, row_cells, row_prices, row_days):
+        self.cells = cells
+        self.dimensions = dimensions
+        self.ranked = ranked
+        self.dates = dates
+        self.uniques = uniques
+        self.key_values = key_values
+        self.row_cells = row_cells
+        self.row_prices = row_prices
+        self.row_days = row_days
+        self.stride = len(uniques) + 1
+
+    def __len__(self):
+        return len(self.ranked)
+
+    def cell_mask(self, date_range=None, **filters):
+        mask = np.ones(len(self.cells['start']), dtype=bool)
+        if date_range is not None:
+            start_month = pd.Timestamp(date_range[0]).to_datetime64().astype('datetime64[M]').astype('int64')
+            end_month = pd.Timestamp(date_range[1]).to_datetime64().astype('datetime64[M]').astype('int64')
+            months = self.cells['month']
+            mask &= (months >= start_month) & (months <= end_month)
+
+        for column, condition in filters.items():
+            if condition is not None:
+                codes, uniques = self.dimensions[column]
+                # The last slot answers for missing values, which factorize codes as -1
+                allowed = np.append(uniques.isin(condition), any(pd.isna(value) for value in condition))
+                mask &= allowed[codes]
+        return mask
+
+    def split_cells(self, date_range=None, **filters):
+        """Masks of selected cells wholly inside the date range, and of those only partly inside."""
+        mask = self.cell_mask(date_range=date_range, **filters)
+        if date_range is None:
+            return mask, np.zeros_like(mask)
+        inside = (self.cells['first_day'] >= day_number(date_range[0])) & (self.cells['last_day'] <= day_number(date_range[1]))
+        return mask & inside, mask & ~inside
+
+    def select_rows(self, date_range=None, **filters):
+        """Positions in the (key, price) ordered rows that match the filters."""
+        whole, partial = self.split_cells(date_range=date_range, **filters)
+        mask = whole[self.row_cells]
+        if partial.any():
+            boundary = np.flatnonzero(partial[self.row_cells])
+            days = self.row_days[boundary]
+            mask[boundary[(days >= day_number(date_range[0])) & (days <= day_number(date_range[1]))]] = True
+        return np.flatnonzero(mask)
+
+    def select(self, date_range=None, **filters):
+        """Rows of the matching cells as a (key, price) frame."""
+        rows = self.select_rows(date_range=date_range, **filters)
+        keys = self.key_values[self.cells['key_code'][self.row_cells[rows]]]
+        return pd.DataFrame({'key': keys, 'price': self.row_prices[rows]})
+
+    def segments(self, whole, partial, date_range=None):
+        """Sorted price runs to merge: (ranked array, cell, start, rows, ranked rows) for each run."""
+        whole = np.flatnonzero(whole)
+        starts, stops, valid = self.cells['start'], self.cells['stop'], self.cells['valid']
+        runs = [(self.ranked, whole, starts[whole], stops[whole] - starts[whole], valid[whole])]
+
+        partial = np.flatnonzero(partial)
+        if len(partial):
+            # Rows of the boundary months that fall inside the range; still sorted within each cell
+            lengths = stops[partial] - starts[partial]
+            rows = np.repeat(starts[partial] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            dates = self.dates[rows]
+            ranked = self.ranked[rows[(dates >= day_number(date_range[0])) & (dates <= day_number(date_range[1]))]]
+            cells = ranked // self.stride
+            kept, run_starts, run_rows = np.unique(cells, return_index=True, return_counts=True)
+            run_valid = np.bincount(np.searchsorted(kept, cells), weights=ranked % self.stride < len(self.uniques), minlength=len(kept))
+            runs.append((ranked, kept, run_starts, run_rows, run_valid.astype('int64')))
+        return runs
+
+    def summarise(self, percentiles, round_digits=None, date_range=None, **filters):
+        """Percentiles and counts per key, as group_quantiles gives over select()."""
+        whole, partial = self.split_cells(date_range=date_range, **filters)
+        n_cells = whole.sum() + partial.sum()
+        if n_cells == 0 or n_cells * RANK_SELECT_CELL_COST > len(self):
+            return self.summarise_rows(percentiles, round_digits, date_range=date_range, **filters)
+        return self.summarise_cells(self.segments(whole, partial, date_range), percentiles, round_digits)
+
+    def summarise_rows(self, percentiles, round_digits=None, date_range=None, **filters):
+        # Selected rows stay in (key, price) order, so the percentiles are picked without sorting
+        rows = self.select_rows(date_range=date_range, **filters)
+        codes = self.cells['key_code'][self.row_cells[rows]]
+        prices = self.row_prices[rows]
+        counts = np.bincount(codes, minlength=len(self.key_values))
+        present = counts > 0
+        valid = ~np.isnan(prices)
+        codes = (np.cumsum(present) - 1)[codes[valid]]
+        return sorted_group_quantiles(codes, prices[valid], counts[present], percentiles, round_digits, pd.Index(self.key_values[present], name='key'))
+
+    def summarise_cells(self, runs, percentiles, round_digits=None):
+        # Merge the selected cells' sorted slices by rank; cost follows the number of cells, not rows
+        cell_keys = self.cells['key_code']
+        present, groups = np.unique(np.concatenate([cell_keys[run[1]] for run in runs]), return_inverse=True)
+        n_groups = len(present)
+        run_groups, offset = [], 0
+        for run in runs:
+            run_groups.append(groups[offset:offset + len(run[1])])
+            offset += len(run[1])
+
+        counts = sum(np.bincount(group, weights=run[3], minlength=n_groups) for run, group in zip(runs, run_groups)).astype('int64')
+        sizes = sum(np.bincount(group, weights=run[4], minlength=n_groups) for run, group in zip(runs, run_groups)).astype('int64')
+        empty = sizes == 0
+        last = np.maximum(sizes - 1, 0)
+
+        # Two target ranks per percentile, interpolated between as np.quantile does
+        positions = np.array([q * last for q in percentiles])
+        lower = np.floor(positions).astype('int64')
+        targets = np.concatenate([lower, np.minimum(lower + 1, last)])
+        values = self.uniques[self.select_ranks(runs, run_groups, targets)]
+
+        n_percentiles = len(percentiles)
+        result = {}
+        for i, q in enumerate(percentiles):
+            column = np.where(empty, np.nan, lerp(values[i], values[n_percentiles + i], positions[i] - lower[i]))
+            if round_digits is not None:
+                column = np.round(column, round_digits)
+            result[q] = column
+
+        summary = pd.DataFrame(result, index=pd.Index(self.key_values[present], name='key'))
+        summary['count'] = counts
+        return summary
+
+    def select_ranks(self, runs, run_groups, targets):
+        """Price rank of the target-th smallest price in each group, by bisecting over price ranks."""
+        n_targets, n_groups = targets.shape
+        lo = np.zeros(targets.shape, dtype='int64')
+        hi = np.full(targets.shape, max(len(self.uniques) - 1, 0), dtype='int64')
+        flat_groups = [(np.arange(n_targets)[:, None] * n_groups + group[None, :]).ravel() for group in run_groups]
+
+        while (lo < hi).any():
+            mid = (lo + hi) // 2
+            below = np.zeros(n_targets * n_groups)
+            for (ranked, cells, starts, _, _), group, flat in zip(runs, run_groups, flat_groups):
+                if len(cells) == 0:
+                    continue
+                # Prices ranked at or below mid in each run, for every target at once
+                bounds = cells[None, :] * self.stride + mid[:, group]
+                found = np.searchsorted(ranked, bounds.ravel(), side='right') - np.tile(starts, n_targets)
+                below += np.bincount(flat, weights=found, minlength=n_targets * n_groups)
+            enough = below.reshape(targets.shape) >= targets + 1
+            active = lo < hi
+            hi = np.where(active & enough, mid, hi)
+            lo = np.where(active & ~enough, mid + 1, lo)
+        return lo
+
+def build_price_cube(df, date_col='date_sold'):
+    frame = df[['key', 'price'] + CUBE_DIMENSIONS].copy()
+    if date_col in df.columns:
+        dates = df[date_col].to_numpy(dtype='datetime64[ns]')
+    else:
+        dates = np.full(len(df), np.datetime64('NaT'), dtype='datetime64[ns]')
+    frame['month'] = dates.astype('datetime64[M]').astype('int64')
+
+    dimensions = ['key', 'month'] + CUBE_DIMENSIONS
+    cell_id = frame.groupby(dimensions, dropna=False, sort=True, observed=True).ngroup().to_numpy()
+    prices = frame['price'].to_numpy(dtype='float64')
+    order = np.lexsort((prices, cell_id))
+    cell_id = cell_id[order]
+    prices = prices[order]
+    days = day_numbers(dates)[order]
+
+    bounds = np.flatnonzero(np.diff(cell_id)) + 1
+    starts = np.concatenate([[0], bounds]) if len(order) else np.array([], dtype='int64')
+    stops = np.concatenate([bounds, [len(order)]]) if len(order) else np.array([], dtype='int64')
+
+    # Missing prices sort last in each cell and rank after every real price
+    missing = np.isnan(prices)
+    uniques = np.unique(prices[~missing])
+    ranks = np.searchsorted(uniques, prices)
+    ranks[missing] = len(uniques)
+
+    table = frame.iloc[order[starts]][dimensions].reset_index(drop=True)
+    key_codes, key_values = pd.factorize(table['key'], sort=True)
+    cells = {
+        'month': table['month'].to_numpy(),
+        'start': starts,
+        'stop': stops,
+        'valid': np.add.reduceat(~missing, starts).astype('int64') if len(order) else starts,
+        'first_day': np.minimum.reduceat(days, starts) if len(order) else starts,
+        'last_day': np.maximum.reduceat(days, starts) if len(order) else starts,
+        'key_code': key_codes,
+    }
+    codes = {}
+    for column in CUBE_DIMENSIONS:
+        column_codes, values = pd.factorize(table[column])
+        codes[column] = (column_codes, pd.Index(values))
+
+    # The same rows ordered by (key, price) for the sort-free row pass; keys come from the cells
+    by_key = np.lexsort((prices, key_codes[cell_id])) if len(order) else np.array([], dtype='int64')
+
+    return PriceCube(
+        cells=cells,
+        dimensions=codes,
+        ranked=cell_id.astype('int64') * (len(uniques) + 1) + ranks,
+        dates=days,
+        uniques=uniques,
+        key_values=np.asarray(key_values),
+        row_cells=cell_id[by_key].astype(np.int32),
+        row_prices=prices[by_key],
+        row_days=days[by_key],
+    )
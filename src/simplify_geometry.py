@@ -0,0 +1,28 @@
+import geopandas as gpd
+from pathlib import Path
+
+root_dir = Path(__file__).parent.parent
+
+# Tolerances in degrees, roughly 10m, 30m and 100m
+SIMPLIFY_TOLERANCES = {
+    'geometry_lod1': 0.0001,
+    'geometry_lod2': 0.0003,
+    'geometry_lod3': 0.001,
+}
+
+def build_simplified_geometries(gdf, tolerances=SIMPLIFY_TOLERANCES):
+    # Coverage simplification keeps shared suburb borders aligned, so no gaps or overlaps appear
+    levels = {column: gdf.geometry.simplify_coverage(tolerance) for column, tolerance in tolerances.items()}
+    simplified = gpd.GeoDataFrame(levels, index=gdf.index, geometry=next(iter(levels)), crs=gdf.crs)
+    return simplified
+
+def main():
+    gdf = gpd.read_feather(root_dir / 'data/geo/gdf_final.feather')
+    simplified = build_simplified_geometries(gdf)
+
+    path_out = root_dir / 'data/geo/gdf_simplified.feather'
+    simplified.to_feather(path_out)
+    print(f"gdf saved: {path_out}")
+
+if __name__ == '__main__':
+    main()
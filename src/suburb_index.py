@@ -0,0 +1,50 @@
+import pandas as pd
+import numpy as np
+import shapely
+
+# Listing coordinate columns: the scraper's own names, then the flattened Domain API property details
+COORDINATE_COLUMNS = [
+    ('latitude', 'longitude'),
+    ('listing.propertyDetails.latitude', 'listing.propertyDetails.longitude'),
+]
+
+class SuburbIndex:
+    """STRtree over suburb polygons for bulk point-in-polygon lookup of listing coordinates."""
+
+    def __init__(self, keys, geometries):
+        self.keys = np.asarray(keys, dtype=object)
+        self.tree = shapely.STRtree(geometries)
+
+    def assign(self, lat, lng):
+        """Suburb key for each point, or None where a point is missing or outside every suburb."""
+        points = shapely.points(np.asarray(lng, dtype=float), np.asarray(lat, dtype=float))
+        point_index, suburb_index = self.tree.query(points, predicate='intersects')
+
+        # A point on a shared border touches two suburbs; the first match wins
+        point_index, first = np.unique(point_index, return_index=True)
+        keys = np.full(len(points), None, dtype=object)
+        keys[point_index] = self.keys[suburb_index[first]]
+        return keys
+
+def build_suburb_index(gdf):
+    gdf = gdf.to_crs('EPSG:4326') if gdf.crs is not None else gdf
+    return SuburbIndex(gdf.index.astype(str), gdf.geometry.values)
+
+def coordinate_columns(df):
+    for lat_column, lng_column in COORDINATE_COLUMNS:
+        if lat_column in df.columns and lng_column in df.columns:
+            return lat_column, lng_column
+    return None
+
+def assign_suburbs(df, suburb_index):
+    """Replace the string key with the suburb polygon each listing falls in, keeping the string key as fallback."""
+    columns = coordinate_columns(df)
+    if suburb_index is None or columns is None:
+        return df
+
+    lat_column, lng_column = columns
+    spatial_keys = suburb_index.assign(pd.to_numeric(df[lat_column], errors='coerce').values, pd.to_numeric(df[lng_column], errors='coerce').values)
+    found = pd.notna(spatial_keys)
+    df['key'] = np.where(found, spatial_keys, df['key'].values)
+    print(f"assigned {found.sum()} of {len(df)} rows to suburbs by location")
+    return df
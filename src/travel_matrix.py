@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import json
+import os
+
+from src.map_funcs import load_geo_data
+
+TRAVEL_MATRIX_DIR = './data/geo/travel-matrix/'
+TRAVEL_MODES = ['driving', 'transit']
+# Minutes are stored as uint16; the top value marks a pair with no route
+NO_ROUTE = np.iinfo(np.uint16).max
+
+class TravelMatrix:
+    """Suburb-to-suburb travel minutes per mode, memory-mapped.
+
+    Matrices are stored destination-major, so every suburb's time to one destination is a
+    single contiguous row.
+    """
+
+    def __init__(self, keys, matrices):
+        self.keys = pd.Index(keys)
+        self.matrices = matrices
+
+    @property
+    def modes(self):
+        return list(self.matrices)
+
+    def minutes_to(self, destination, mode):
+        row = self.matrices[mode][self.keys.get_loc(destination)]
+        return pd.Series(np.where(row == NO_ROUTE, np.nan, row), index=self.keys)
+
+def matrix_path(mode, matrix_dir=TRAVEL_MATRIX_DIR):
+    return os.path.join(matrix_dir, f"{mode}.u16")
+
+def write_matrix(matrix, file_path):
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    out = np.memmap(tmp_path, dtype=np.uint16, mode='w+', shape=matrix.shape)
+    out[:] = matrix
+    out.flush()
+    del out
+    os.replace(tmp_path, file_path)
+
+def load_travel_matrix(matrix_dir=TRAVEL_MATRIX_DIR):
+    try:
+        with open(os.path.join(matrix_dir, 'keys.json'), 'r') as file:
+            meta = json.load(file)
+    except (IOError, ValueError):
+        return None
+    n = len(meta['keys'])
+    matrices = {mode: np.memmap(matrix_path(mode, matrix_dir), dtype=np.uint16, mode='r', shape=(n, n)) for mode in meta['modes']}
+    return TravelMatrix(meta['keys'], matrices)
+
+def build_travel_matrix(gdf, modes=TRAVEL_MODES, engine=None, matrix_dir=TRAVEL_MATRIX_DIR):
+    """Travel minutes between every pair of suburb centroids, requested through the cached commute engine."""
+    # Only building needs the maps client, so the app can load the matrix without googlemaps
+    from src.get_travel_time_and_seifa import CommuteEngine, location_key
+
+    engine = engine or CommuteEngine()
+    origins = list(zip(gdf['centroid_lat'], gdf['centroid_lng']))
+    os.makedirs(matrix_dir, exist_ok=True)
+
+    for mode in modes:
+        destinations = {i: (location_key(origin), mode) for i, origin in enumerate(origins)}
+        minutes = engine.durations(origins, destinations)
+        matrix = np.array([[NO_ROUTE if value is None else min(value, NO_ROUTE - 1) for value in minutes[i]] for i in range(len(origins))], dtype=np.uint16)
+        write_matrix(matrix, matrix_path(mode, matrix_dir))
+        print(f"{mode} matrix saved: {matrix_path(mode, matrix_dir)}")
+
+    # Keys are written last, so a reader never sees keys without their matrices
+    keys_path = os.path.join(matrix_dir, 'keys.json')
+    with open(f"{keys_path}.{os.getpid()}.tmp", 'w') as file:
+        json.dump({'keys': list(gdf.index.astype(str)), 'modes': list(modes)}, file)
+    os.replace(f"{keys_path}.{os.getpid()}.tmp", keys_path)
+    return load_travel_matrix(matrix_dir)
+
+def main():
+    gdf = load_geo_data()
+    build_travel_matrix(gdf)
+
+if __name__ == '__main__':
+    main()
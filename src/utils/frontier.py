@@ -0,0 +1,107 @@
+import sqlite3
+import time
+import os
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    run_id TEXT,
+    locality TEXT,
+    page INTEGER,
+    state TEXT,
+    attempts INTEGER DEFAULT 0,
+    output_file TEXT,
+    updated_at REAL,
+    PRIMARY KEY (run_id, locality, page)
+);
+CREATE TABLE IF NOT EXISTS localities (
+    run_id TEXT,
+    locality TEXT,
+    finished_at REAL,
+    PRIMARY KEY (run_id, locality)
+);
+"""
+
+class CrawlFrontier:
+    """(locality, page) tasks of one crawl run kept in SQLite, so a restarted run resumes where it stopped.
+
+    A task is 'pending' from when it is queued until its result is recorded as 'done' or 'failed';
+    tasks still pending after a crash are retried like failed ones, up to max_attempts.
+    """
+
+    def __init__(self, path, run_id, max_attempts=3):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.run_id = run_id
+        self.max_attempts = max_attempts
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.executescript(SCHEMA)
+
+    def schedule(self, locality, page):
+        self.connection.execute(
+            "INSERT INTO tasks (run_id, locality, page, state, attempts, updated_at) VALUES (?, ?, ?, 'pending', 1, ?) "
+            "ON CONFLICT (run_id, locality, page) DO UPDATE SET state = 'pending', attempts = attempts + 1, updated_at = excluded.updated_at",
+            (self.run_id, locality, page, time.time()))
+
+    def record(self, locality, page, failed, output_file=None):
+        self.connection.execute(
+            "UPDATE tasks SET state = ?, output_file = ?, updated_at = ? WHERE run_id = ? AND locality = ? AND page = ?",
+            ('failed' if failed else 'done', output_file, time.time(), self.run_id, locality, page))
+
+    def finish(self, locality):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO localities (run_id, locality, finished_at) VALUES (?, ?, ?)",
+            (self.run_id, locality, time.time()))
+
+    def is_finished(self, locality):
+        return self.connection.execute(
+            "SELECT 1 FROM localities WHERE run_id = ? AND locality = ?", (self.run_id, locality)).fetchone() is not None
+
+    def plan(self, locality, start, last_page):
+        """Pages to retry, and the page to continue the locality from (None once it is finished)."""
+        rows = self.connection.execute(
+            "SELECT page, state, attempts FROM tasks WHERE run_id = ? AND locality = ? ORDER BY page",
+            (self.run_id, locality)).fetchall()
+        retries = [page for page, state, attempts in rows if state != 'done' and attempts < self.max_attempts]
+
+        if self.is_finished(locality):
+            return retries, None
+        if not rows:
+            return retries, start
+
+        page, state, attempts = rows[-1]
+        if state != 'done' and attempts < self.max_attempts:
+            # The last page reached decides whether the locality carries on, so it is the head, not a retry
+            retries.remove(page)
+            return retries, page
+        if page >= last_page:
+            self.finish(locality)
+            return retries, None
+        return retries, page + 1
+
+    def output_runs(self, locality, output_files):
+        """Runs, of any run_id, whose tasks for the locality wrote one of the given files."""
+        output_files = {os.path.normpath(path) for path in output_files}
+        rows = self.connection.execute(
+            "SELECT DISTINCT run_id, output_file FROM tasks WHERE locality = ? AND output_file IS NOT NULL", (locality,)).fetchall()
+        return sorted({run_id for run_id, output_file in rows if os.path.normpath(output_file) in output_files})
+
+    def watermark_pages(self, locality):
+        """Output files of done pages that are safe to move the locality's watermark past.
+
+        Results are newest first, so a mark taken from a page newer than a failed or pending page
+        would make the next run stop before re-fetching it. Until the locality finishes nothing is
+        safe; after that, only pages beyond the last page that is not done.
+        """
+        if not self.is_finished(locality):
+            return []
+        rows = self.connection.execute(
+            "SELECT page, state, output_file FROM tasks WHERE run_id = ? AND locality = ? ORDER BY page",
+            (self.run_id, locality)).fetchall()
+        last_gap = max([page for page, state, _ in rows if state != 'done'], default=0)
+        return [output_file for page, state, output_file in rows if state == 'done' and page > last_gap and output_file]
+
+    def summary(self):
+        return dict(self.connection.execute(
+            "SELECT state, COUNT(*) FROM tasks WHERE run_id = ? GROUP BY state", (self.run_id,)).fetchall())
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,103 @@
+import pyarrow.parquet as pq
+import pyarrow as pa
+import pandas as pd
+import json
+import os
+
+from src.utils import snapshot
+
+MANIFEST_FILE = '_manifest.json'
+WATERMARK_FILE = '_watermarks.json'
+ARROW_ERRORS = (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError)
+
+def partition_path(root, date, suburb, part='part-0'):
+    return os.path.join(root, f"date={date}", f"suburb={suburb}", f"{part}.parquet")
+
+def stringify_nested(df):
+    # Nested API fields can have inconsistent shapes across rows, so store them as JSON text
+    df = df.copy()
+    for column in df.columns[df.dtypes == object]:
+        if df[column].map(lambda x: isinstance(x, (list, dict))).any():
+            df[column] = df[column].map(lambda x: json.dumps(x, default=str) if isinstance(x, (list, dict)) else x)
+    return df
+
+def write_partition(df, root, date, suburb, part='part-0'):
+    """Write one fetch as its own partition file; re-fetching the same partition replaces it."""
+    file_path = partition_path(root, date, suburb, part)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path, index=False)
+    except ARROW_ERRORS:
+        stringify_nested(df).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, file_path)
+    return file_path
+
+def read_manifest(root):
+    return snapshot.read_manifest(root, file_name=MANIFEST_FILE)
+
+def write_manifest(root, manifest):
+    snapshot.write_manifest(root, manifest, file_name=MANIFEST_FILE)
+
+def read_watermarks(root):
+    return snapshot.read_manifest(root, file_name=WATERMARK_FILE)
+
+def write_watermarks(root, watermarks):
+    snapshot.write_manifest(root, watermarks, file_name=WATERMARK_FILE)
+
+def parse_partition(relative_path):
+    date_dir, suburb_dir, file_name = relative_path.split(os.sep)[-3:]
+    return {'date': date_dir.split('=', 1)[1], 'suburb': suburb_dir.split('=', 1)[1], 'part': file_name[:-len('.parquet')]}
+
+def list_partitions(root):
+    partitions = {}
+    if not os.path.exists(root):
+        return partitions
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            if file_name.endswith('.parquet'):
+                file_path = os.path.join(dir_path, file_name)
+                stat = os.stat(file_path)
+                partitions[os.path.relpath(file_path, root)] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    return partitions
+
+def ingest_partitions(root):
+    """Record partitions written since the last ingest, reading only those. Returns the new entries."""
+    manifest = read_manifest(root)
+    new_entries = {}
+
+    for relative_path, stat in list_partitions(root).items():
+        previous = manifest.get(relative_path)
+        if previous and previous['size'] == stat['size'] and previous['mtime'] == stat['mtime']:
+            continue
+        try:
+            # The row count is in the parquet footer, so the data pages are never read
+            rows = pq.ParquetFile(os.path.join(root, relative_path)).metadata.num_rows
+        except Exception as e:
+            print(f"Error reading {relative_path}: {e}")
+            continue
+        new_entries[relative_path] = dict(stat, rows=rows, **parse_partition(relative_path))
+
+    if new_entries:
+        manifest.update(new_entries)
+        write_manifest(root, manifest)
+    return new_entries
+
+def read_listings(root, date_from=None, date_to=None, suburbs=None, columns=None):
+    """Read the ingested partitions inside the date range and suburb list."""
+    frames = []
+    for relative_path, entry in sorted(read_manifest(root).items()):
+        if date_from is not None and entry['date'] < date_from:
+            continue
+        if date_to is not None and entry['date'] > date_to:
+            continue
+        if suburbs is not None and entry['suburb'] not in suburbs:
+            continue
+        df = pd.read_parquet(os.path.join(root, relative_path), columns=columns)
+        df['partition_date'] = entry['date']
+        df['partition_suburb'] = entry['suburb']
+        frames.append(df)
+
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
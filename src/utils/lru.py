@@ -0,0 +1,58 @@
+from collections import OrderedDict
+import threading
+import sys
+
+class BoundedLRU:
+    """Thread-safe LRU cache bounded by entry count and by the total size of its values."""
+
+    def __init__(self, max_entries=64, max_bytes=None, sizeof=sys.getsizeof):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.sizes.pop(key)
+                del self.entries[key]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or (self.max_bytes is not None and self.total_bytes > self.max_bytes):
+                old_key, _ = self.entries.popitem(last=False)
+                self.total_bytes -= self.sizes.pop(old_key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.total_bytes, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,137 @@
+from collections import deque
+import threading
+import functools
+import cProfile
+import pstats
+import json
+import time
+import io
+import os
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Off unless set: '1' records timing and memory spans, 'cprofile' also profiles each run
+PROFILE_MODE = os.getenv('HOMERUN_PROFILE', '')
+PROFILE_LOG = os.getenv('HOMERUN_PROFILE_LOG', './data/cache/profile.jsonl')
+RECENT_RUNS = 50
+PROFILE_TOP_FUNCTIONS = 25
+
+ENABLED = PROFILE_MODE not in ('', '0')
+recent_runs = deque(maxlen=RECENT_RUNS)
+log_lock = threading.Lock()
+local = threading.local()
+
+def rss_mb():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    # Without psutil fall back to the peak RSS, which is still enough to see growth
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return 0.0
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.depth = len(self.trace['stack'])
+        self.trace['stack'].append(self.name)
+        self.memory = rss_mb()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.trace['stack'].pop()
+        self.trace['spans'].append({
+            'name': self.name,
+            'depth': self.depth,
+            'start_ms': round((self.start - self.trace['started']) * 1000, 2),
+            'ms': round(seconds * 1000, 2),
+            'rss_delta_mb': round(rss_mb() - self.memory, 1),
+        })
+        return False
+
+def span(name):
+    """Time a block within the current run; a shared no-op when profiling is off or no run is active."""
+    if not ENABLED:
+        return NULL_SPAN
+    trace = getattr(local, 'trace', None)
+    if trace is None:
+        return NULL_SPAN
+    return Span(trace, name)
+
+def profiled(name=None):
+    def decorator(func):
+        if not ENABLED:
+            return func
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def start_run(label='rerun'):
+    if not ENABLED:
+        return
+    local.trace = {'label': label, 'time': time.time(), 'started': time.perf_counter(), 'stack': [], 'spans': []}
+    if PROFILE_MODE == 'cprofile':
+        local.profiler = cProfile.Profile()
+        local.profiler.enable()
+
+def end_run(**extra):
+    """Close the current run, keep it in recent_runs and append it to the JSON lines log."""
+    trace = getattr(local, 'trace', None)
+    if not ENABLED or trace is None:
+        return None
+    local.trace = None
+
+    run = {
+        'label': trace['label'],
+        'time': trace['time'],
+        'total_ms': round((time.perf_counter() - trace['started']) * 1000, 2),
+        # Spans are recorded as they close; sort so parents come before their children
+        'spans': sorted(trace['spans'], key=lambda s: (s['start_ms'], s['depth'])),
+        **extra,
+    }
+    profiler = getattr(local, 'profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        local.profiler = None
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        run['profile'] = stream.getvalue()
+
+    recent_runs.append(run)
+    if PROFILE_LOG:
+        try:
+            os.makedirs(os.path.dirname(PROFILE_LOG) or '.', exist_ok=True)
+            with log_lock, open(PROFILE_LOG, 'a') as file:
+                file.write(json.dumps(run, default=str) + '\n')
+        except IOError as e:
+            print(f"could not write profile log: {e}")
+    return run
+
+def runs_jsonl():
+    return ''.join(json.dumps(run, default=str) + '\n' for run in recent_runs)
@@ -1,13 +1,28 @@
 import pandas as pd
 import requests
+import threading
+import atexit
+import queue
+import time
 import os
 
+from src.utils.ratelimit import TokenBucket
+
 # Assume these values are now being loaded from a .env file
 DEFAULT_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 DEFAULT_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+# Overridable so the notifier can be pointed at a local stub
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
 
-def send_telegram_message(bot_message, production_mode=False, chat_group=None, bot_token=None):
-    
+# Progress messages arriving within DIGEST_SECONDS of each other are sent as one message;
+# Telegram allows about one message per second to a chat
+DIGEST_SECONDS = 5.0
+MESSAGES_PER_SECOND = 1.0
+MAX_QUEUED_MESSAGES = 1000
+MAX_MESSAGE_LENGTH = 4096
+SEND_TIMEOUT = 10
+
+def resolve_chat(production_mode=False, chat_group=None, bot_token=None):
     effective_bot_token = bot_token
     if effective_bot_token is None:
         effective_bot_token = os.getenv('TELEGRAM_BOT_TOKEN', DEFAULT_BOT_TOKEN)
@@ -15,8 +30,8 @@ def send_telegram_message(bot_message, production_mode=False, chat_group=None, b
     chat_ids = {
         # 'player-markets': '-1001668549483'
     }
-   
-    effective_bot_chat_id = None 
+
+    effective_bot_chat_id = None
     if chat_group is not None:
         effective_bot_chat_id = chat_ids.get(chat_group) if production_mode else DEFAULT_CHAT_ID
         if production_mode and chat_ids.get(chat_group) is None:
@@ -26,23 +41,141 @@ def send_telegram_message(bot_message, production_mode=False, chat_group=None, b
         # If no chat_group, use TELEGRAM_CHAT_ID from env, or fallback to DEFAULT_CHAT_ID
         effective_bot_chat_id = os.getenv('TELEGRAM_CHAT_ID', DEFAULT_CHAT_ID)
 
+    return effective_bot_token, effective_bot_chat_id
+
+def digest_chunks(messages, max_length=MAX_MESSAGE_LENGTH):
+    chunks, current = [], ''
+    for message in messages:
+        message = message[:max_length]
+        if current and len(current) + len(message) + 1 > max_length:
+            chunks.append(current)
+            current = ''
+        current = f"{current}\n{message}" if current else message
+    if current:
+        chunks.append(current)
+    return chunks
+
+class TelegramNotifier:
+    """Sends messages from a background thread so callers never wait on Telegram.
+
+    Messages go on a bounded queue (dropped, and counted, if it is full), are gathered for
+    `digest_seconds`, and sent per chat as digests no faster than `messages_per_second`.
+    """
+
+    def __init__(self, api_url=TELEGRAM_API_URL, digest_seconds=DIGEST_SECONDS, messages_per_second=MESSAGES_PER_SECOND, max_queued=MAX_QUEUED_MESSAGES, timeout=SEND_TIMEOUT):
+        self.api_url = api_url
+        self.digest_seconds = digest_seconds
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.rate_limiter = TokenBucket(messages_per_second, capacity=1)
+        self.session = requests.Session()
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='telegram-notifier', daemon=True)
+                self.thread.start()
+
+    def notify(self, bot_message, bot_token, chat_id):
+        self.start()
+        try:
+            self.queue.put_nowait((bot_token, chat_id, str(bot_message)))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.digest_seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            chats = {}
+            for bot_token, chat_id, bot_message in batch:
+                chats.setdefault((bot_token, chat_id), []).append(bot_message)
+
+            with self.lock:
+                dropped, self.dropped = self.dropped, 0
+            for (bot_token, chat_id), messages in chats.items():
+                if dropped:
+                    messages.append(f"({dropped} messages dropped)")
+                    dropped = 0
+                for text in digest_chunks(messages):
+                    self.send(bot_token, chat_id, text)
+
+            for _ in batch:
+                self.queue.task_done()
+
+    def send(self, bot_token, chat_id, text):
+        url = f"{self.api_url}/bot{bot_token}/sendMessage"
+        data = {'chat_id': chat_id, 'text': text, 'parse_mode': 'Markdown', 'disable_web_page_preview': 'true'}
+        for attempt in range(3):
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.post(url, data=data, timeout=self.timeout)
+                if response.status_code == 429:
+                    # Telegram says how long to back off for
+                    time.sleep(response.json().get('parameters', {}).get('retry_after', 1))
+                    continue
+                response.raise_for_status()
+                return True
+            except (requests.exceptions.RequestException, ValueError):
+                break
+        print(f"{text}")
+        return False
+
+    def flush(self, timeout=30):
+        """Wait (up to timeout seconds) until everything queued so far has been sent."""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self.queue.unfinished_tasks
+
+NOTIFIER = None
+notifier_lock = threading.Lock()
+
+def get_notifier():
+    global NOTIFIER
+    with notifier_lock:
+        if NOTIFIER is None:
+            NOTIFIER = TelegramNotifier()
+            # The worker is a daemon thread, so give pending digests a chance to go out on exit
+            atexit.register(NOTIFIER.flush)
+    return NOTIFIER
+
+def flush_telegram_messages(timeout=30):
+    # Worker processes exit without running atexit hooks, so they flush explicitly
+    if NOTIFIER is not None:
+        return NOTIFIER.flush(timeout)
+    return True
+
+def send_telegram_message(bot_message, production_mode=False, chat_group=None, bot_token=None):
+    """Queue a message for the background notifier; returns immediately."""
+    effective_bot_token, effective_bot_chat_id = resolve_chat(production_mode, chat_group, bot_token)
+
     if not effective_bot_token or not effective_bot_chat_id:
         print(f"Telegram fallback: BOT_TOKEN or CHAT_ID is missing or invalid.")
         print(f"Intended message: {bot_message}")
         return
 
-    send_text = (f'https://api.telegram.org/bot{effective_bot_token}'
-                 f'/sendMessage?chat_id={effective_bot_chat_id}'
-                 f'&parse_mode=Markdown&disable_web_page_preview=true&text={bot_message}')
-    try:
-        response = requests.get(send_text)
-        response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-    except requests.exceptions.RequestException as e:
-        print(f"{bot_message}")
+    get_notifier().notify(bot_message, effective_bot_token, effective_bot_chat_id)
 
 
 def get_telegram_messages(bot_token=None):
     effective_bot_token = bot_token
     if effective_bot_token is None:
         effective_bot_token = os.getenv('TELEGRAM_BOT_TOKEN', DEFAULT_BOT_TOKEN)
-    return requests.get(f'https://api.telegram.org/bot{effective_bot_token}/getUpdates').content
+    return requests.get(f'{TELEGRAM_API_URL}/bot{effective_bot_token}/getUpdates', timeout=SEND_TIMEOUT).content
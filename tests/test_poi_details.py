@@ -0,0 +1,60 @@
+import googlemaps
+import pytest
+
+from src.get_poi_details import get_poi_details, cache_path, read_cached, POI_FIELDS
+
+PLACE = {'result': {
+    'formatted_address': '1 Main St, Abbotsford NSW 2046',
+    'address_components': [
+        {'types': ['street_number'], 'long_name': '1'},
+        {'types': ['route'], 'long_name': 'Main St'},
+        {'types': ['locality'], 'long_name': 'Abbotsford'},
+        {'types': ['postal_code'], 'long_name': '2046'},
+    ],
+    'geometry': {'location': {'lat': -33.85, 'lng': 151.13}},
+}}
+
+class FakeClient:
+    """Answers places() with the given results or raises the given error."""
+
+    def __init__(self, results=None, error=None):
+        self.results = results
+        self.error = error
+        self.calls = 0
+
+    def places(self, query):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return {'results': self.results}
+
+    def place(self, place_id):
+        return PLACE
+
+def test_found_poi_is_cached(tmp_path):
+    client = FakeClient(results=[{'place_id': 'abc'}])
+    result = get_poi_details('Abbotsford Park, Sydney NSW', tmp_path, client)
+    assert result['poi'] == 'Abbotsford Park' and result['postcode'] == '2046'
+    assert read_cached(cache_path('Abbotsford Park, Sydney NSW', tmp_path)) == result
+
+@pytest.mark.parametrize('client', [
+    FakeClient(results=[]),
+    FakeClient(error=googlemaps.exceptions.ApiError('NOT_FOUND')),
+])
+def test_no_result_is_negatively_cached(tmp_path, client):
+    assert get_poi_details('Nowhere, Sydney NSW', tmp_path, client) == dict.fromkeys(POI_FIELDS)
+    get_poi_details('Nowhere, Sydney NSW', tmp_path, client)
+    assert client.calls == 1
+
+@pytest.mark.parametrize('error', [
+    googlemaps.exceptions.Timeout(),
+    googlemaps.exceptions.TransportError(ConnectionResetError('reset by peer')),
+    googlemaps.exceptions.ApiError('OVER_QUERY_LIMIT'),
+    googlemaps.exceptions.ApiError('REQUEST_DENIED', 'The provided API key is invalid.'),
+])
+def test_request_errors_are_not_cached(tmp_path, error):
+    client = FakeClient(error=error)
+    assert get_poi_details('Abbotsford Park, Sydney NSW', tmp_path, client) == dict.fromkeys(POI_FIELDS)
+    assert not cache_path('Abbotsford Park, Sydney NSW', tmp_path).exists()
+    get_poi_details('Abbotsford Park, Sydney NSW', tmp_path, client)
+    assert client.calls == 2
@@ -0,0 +1,44 @@
+import pandas as pd
+
+from src.map_funcs import load_sales_data, SALES_DATASET, SALES_PATH
+from src.utils.listing_store import write_partition, ingest_partitions
+
+def scraped_page(links, prices, beds, date_sold):
+    # Columns as the scraper writes them: counts are strings and the suburb is only in the address
+    return pd.DataFrame({
+        'link': links,
+        'price': prices,
+        'address1': ['1 Main St'] * len(links),
+        'address2': ['ABBOTSFORD NSW 2046'] * len(links),
+        'beds': beds,
+        'baths': ['1'] * len(links),
+        'parking': ['−'] * len(links),
+        'home_type': ['Unit'] * len(links),
+        'date_sold': pd.to_datetime([date_sold] * len(links)),
+        'latitude': [None] * len(links),
+        'longitude': [None] * len(links),
+    })
+
+def test_sales_load_from_partitioned_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_partition(scraped_page(['a', 'b'], [900000, 1000000], ['2', '3'], '2024-01-09'), SALES_DATASET, '20240110', 'abbotsford-nsw-2046', part='page-1')
+    # Re-fetched a day later with a corrected price; the newer copy wins
+    write_partition(scraped_page(['b'], [1100000], ['3'], '2024-01-09'), SALES_DATASET, '20240111', 'abbotsford-nsw-2046', part='page-1')
+    ingest_partitions(SALES_DATASET)
+
+    df = load_sales_data().sort_values('price')
+    assert list(df['key'].astype(str)) == ['Abbotsford - 2046', 'Abbotsford - 2046']
+    assert list(df['price']) == [900000, 1100000]
+    assert list(df['beds']) == [2, 3]
+    assert (df['home_type'] == 'Unit').all()
+
+def test_sales_fall_back_to_csv_without_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / SALES_PATH).parent.mkdir(parents=True)
+    pd.DataFrame({
+        'suburb': ['ABBOTSFORD'], 'postcode': [2046], 'price': [900000], 'beds': [2], 'baths': [1],
+        'parking': [1], 'home_type': ['Unit'], 'date_sold': ['2024-01-09'],
+    }).to_csv(tmp_path / SALES_PATH, index=False)
+
+    df = load_sales_data()
+    assert list(df['key'].astype(str)) == ['Abbotsford - 2046']
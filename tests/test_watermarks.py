@@ -0,0 +1,53 @@
+import pandas as pd
+
+from src.get_sales_selenium import advance_watermarks, overlaps_watermark
+from src.utils.frontier import CrawlFrontier
+from src.utils.listing_store import write_partition, ingest_partitions
+
+LOCALITY = 'abbotsford-nsw-2046'
+
+def page_frame(page):
+    # Newest first: page 1 sold on the 9th and 8th, page 2 on the 7th and 6th, page 3 on the 5th and 4th
+    days = [11 - 2 * page, 10 - 2 * page]
+    return pd.DataFrame({
+        'link': [f"https://www.domain.com.au/listing-{page}-{i}" for i in range(2)],
+        'date_sold': pd.to_datetime([f"2024-01-0{day}" for day in days]),
+    })
+
+def crawl(root, frontier_path, run_id, outcomes, finish=True):
+    """Record one run's pages as the scrapers do: failed pages write no partition."""
+    frontier = CrawlFrontier(frontier_path, run_id)
+    for page, failed in outcomes.items():
+        frontier.schedule(LOCALITY, page)
+        output_file = None if failed else write_partition(page_frame(page), root, run_id, LOCALITY, part=f"page-{page}")
+        frontier.record(LOCALITY, page, failed, output_file)
+    if finish:
+        frontier.finish(LOCALITY)
+    frontier.close()
+
+def test_failed_page_keeps_mark_below_it(tmp_path):
+    root, frontier_path = str(tmp_path / 'dataset'), str(tmp_path / 'frontier.sqlite')
+    crawl(root, frontier_path, '20240110', {1: False, 2: True, 3: False})
+
+    mark = advance_watermarks(ingest_partitions(root), root, frontier_path)[LOCALITY]
+    assert mark['date_sold'] == '2024-01-05'
+
+    # The next run must not stop before reaching the page that failed
+    assert not overlaps_watermark(page_frame(1), mark)
+    assert not overlaps_watermark(page_frame(2), mark)
+    assert overlaps_watermark(page_frame(3), mark)
+
+def test_clean_run_moves_mark_to_newest_page(tmp_path):
+    root, frontier_path = str(tmp_path / 'dataset'), str(tmp_path / 'frontier.sqlite')
+    crawl(root, frontier_path, '20240110', {1: False, 2: True, 3: False})
+    advance_watermarks(ingest_partitions(root), root, frontier_path)
+
+    crawl(root, frontier_path, '20240111', {1: False, 2: False, 3: False})
+    mark = advance_watermarks(ingest_partitions(root), root, frontier_path)[LOCALITY]
+    assert mark['date_sold'] == '2024-01-09'
+
+def test_unfinished_run_leaves_no_mark(tmp_path):
+    root, frontier_path = str(tmp_path / 'dataset'), str(tmp_path / 'frontier.sqlite')
+    crawl(root, frontier_path, '20240110', {1: False, 2: False}, finish=False)
+
+    assert LOCALITY not in advance_watermarks(ingest_partitions(root), root, frontier_path)